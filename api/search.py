@@ -1,29 +1,95 @@
 from flask import Blueprint, request, jsonify
 from werkzeug.utils import secure_filename
 import os
+import re
+import logging
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import numpy as np
 import config
-from utils.query_enhancer import enhance_query
-from utils.image_processor import load_image, resize_image
-from api.utils import allowed_file, calculate_combined_score
+from core.feedback import FEEDBACK_TYPES
+from utils.query_enhancer import enhance_query, ensemble_prompts
+from utils.image_processor import load_image, resize_image, MAX_IMAGE_SIZE
+from utils.query_cache import get_text_embedding, SemanticResultCache
+from utils.batch_encoder import BatchTextEncoder
+from api.utils import allowed_file, calculate_combined_scores, json_response
 
 search_bp = Blueprint('search', __name__)
+logger = logging.getLogger(__name__)
 
 # These will be injected by the main app
 clip_model = None
 faiss_index = None
 feedback_manager = None
 
+# Text encoder used by the search endpoints: the CLIP model itself, or a
+# micro-batching wrapper around it (same encode_text interface)
+text_encoder = None
+
+# Results of recent text queries, reused for near-duplicate query embeddings
+semantic_cache = SemanticResultCache(
+    maxsize=config.SEMANTIC_CACHE_SIZE,
+    threshold=config.SEMANTIC_CACHE_THRESHOLD
+)
+
+# Shared pool for decoding/resizing uploads (PIL releases the GIL)
+preprocess_pool = ThreadPoolExecutor(max_workers=config.IMAGE_PREPROCESS_WORKERS)
+
 
 def init_search_api(clip, faiss, feedback):
     """Initialize API with model instances."""
-    global clip_model, faiss_index, feedback_manager
+    global clip_model, faiss_index, feedback_manager, text_encoder
     clip_model = clip
     faiss_index = faiss
     feedback_manager = feedback
 
+    if config.ENABLE_TEXT_BATCHING:
+        text_encoder = BatchTextEncoder(
+            clip,
+            max_batch_size=config.TEXT_BATCH_MAX_SIZE,
+            max_wait_ms=config.TEXT_BATCH_MAX_WAIT_MS
+        )
+    else:
+        text_encoder = clip
+
+    # Pay cold-start costs now instead of on the first request
+    if config.ENABLE_WARMUP:
+        clip_model.warmup()
+        faiss_index.warmup()
+
+
+def _encode_text_query(query, enhanced_query):
+    """
+    Get the (cached) text embedding for a query.
+
+    Args:
+        query: Raw user query (stripped)
+        enhanced_query: Result of enhance_query(query), or query itself
 
+    Returns:
+        Normalized float32 feature vector (read-only)
+    """
+    # Queries that enhancement rewrote are encoded as a prompt ensemble
+    if config.ENABLE_PROMPT_ENSEMBLE and enhanced_query != query:
+        return get_text_embedding(text_encoder, ensemble_prompts(query))
+    return get_text_embedding(text_encoder, enhanced_query)
+
+
+def _decode_and_resize(image_stream):
+    """Decode an uploaded image stream and resize for encoding."""
+    image = resize_image(load_image(image_stream, max_size=MAX_IMAGE_SIZE))
+    # PIL decodes lazily and small images come back from resize_image
+    # untouched; force the decode here so it runs on the pool thread
+    image.load()
+    return image
+
+
+# Matches everything after the last 'data/images/' in an image path
+_IMAGE_URL_RE = re.compile(r'.*data/images/(.*)$')
+
+
+@functools.lru_cache(maxsize=65536)
 def convert_image_path_to_url(image_path):
     """
     Convert file system image path to web URL.
@@ -34,24 +100,43 @@ def convert_image_path_to_url(image_path):
     Returns:
         Web-accessible URL path
     """
-    # Convert to Path object
-    path = Path(image_path)
-
-    # Get the filename
-    filename = path.name
-
-    # If path contains 'data/images', extract everything after it
-    path_str = str(path)
-    if 'data/images' in path_str:
-        # Extract the part after 'data/images/'
-        parts = path_str.split('data/images/')
-        if len(parts) > 1:
-            filename = parts[-1].lstrip('./')
+    # If path contains 'data/images/', keep everything after it
+    match = _IMAGE_URL_RE.match(str(image_path))
+    if match:
+        filename = match.group(1).lstrip('./')
+    else:
+        filename = Path(image_path).name
 
     # Convert to web URL format
     return f"/images/{filename}"
 
 
+def format_results(results):
+    """
+    Format search results for the frontend.
+
+    Args:
+        results: List of search results from FAISS (optionally reranked)
+
+    Returns:
+        List of result dicts with web URLs and percentage scores
+    """
+    # Convert all scores to percentages in one vectorized pass
+    scores = np.fromiter((result['score'] for result in results), dtype=np.float64, count=len(results))
+    scores = np.round(scores * 100, 2).tolist()
+
+    return [
+        {
+            'image_id': result['image_id'],
+            'image_path': convert_image_path_to_url(result['image_path']),
+            'score': score,
+            'filename': result['metadata'].get('filename', ''),
+            'metadata': result['metadata']
+        }
+        for result, score in zip(results, scores)
+    ]
+
+
 @search_bp.route('/text', methods=['POST'])
 def search_by_text():
     """
@@ -76,39 +161,42 @@ def search_by_text():
         # Enhance query if requested
         if enhance:
             enhanced_query = enhance_query(query)
-            print(f"Original query: '{query}' -> Enhanced: '{enhanced_query}'")
+            logger.info("Original query: '%s' -> Enhanced: '%s'", query, enhanced_query)
         else:
             enhanced_query = query
 
         # Encode query
-        query_vector = clip_model.encode_text(enhanced_query)[0]
-
-        # Search in FAISS
-        retrieve_k = config.FAISS_RETRIEVE_K if config.ENABLE_RERANK else top_k
-        results = faiss_index.search(query_vector, top_k=retrieve_k)
-
-        # TODO: Add reranking if enabled
-        if config.ENABLE_RERANK and len(results) > top_k:
-            # For now, just truncate to top_k
-            # Reranking will be implemented in Phase 6
-            results = results[:top_k]
-
-        # Update query stats
-        if results:
+        query_vector = _encode_text_query(query, enhanced_query)
+
+        # Reuse results of a near-duplicate query if one was seen recently
+        results = None
+        if config.ENABLE_SEMANTIC_CACHE:
+            results = semantic_cache.lookup(query_vector, key=top_k)
+        cache_hit = results is not None
+
+        if not cache_hit:
+            # Search in FAISS
+            retrieve_k = config.FAISS_RETRIEVE_K if config.ENABLE_RERANK else top_k
+            results = faiss_index.search(query_vector, top_k=retrieve_k)
+
+            # TODO: Add reranking if enabled
+            if config.ENABLE_RERANK and len(results) > top_k:
+                # For now, just truncate to top_k
+                # Reranking will be implemented in Phase 6
+                results = results[:top_k]
+
+            if config.ENABLE_SEMANTIC_CACHE:
+                semantic_cache.add(query_vector, results, key=top_k)
+
+        # Update query stats (not on a semantic cache hit: the scores there
+        # belong to the near-duplicate query that filled the cache)
+        if results and not cache_hit:
             feedback_manager.update_query_stats(query, results[0]['score'])
 
         # Format results for frontend
-        formatted_results = []
-        for result in results:
-            formatted_results.append({
-                'image_id': result['image_id'],
-                'image_path': convert_image_path_to_url(result['image_path']),
-                'score': round(result['score'] * 100, 2),  # Convert to percentage
-                'filename': result['metadata'].get('filename', ''),
-                'metadata': result['metadata']
-            })
+        formatted_results = format_results(results)
 
-        return jsonify({
+        return json_response({
             'success': True,
             'query': query,
             'enhanced_query': enhanced_query if enhance else None,
@@ -117,7 +205,7 @@ def search_by_text():
         })
 
     except Exception as e:
-        print(f"Error in text search: {str(e)}")
+        logger.exception("Error in text search: %s", e)
         return jsonify({'error': str(e)}), 500
 
 
@@ -138,9 +226,8 @@ def search_by_image():
 
         top_k = int(request.form.get('top_k', config.DEFAULT_TOP_K))
 
-        # Read and process image
-        image_bytes = file.read()
-        image = load_image(image_bytes)
+        # Read and process image (decoded straight from the upload stream)
+        image = load_image(file.stream, max_size=MAX_IMAGE_SIZE)
         image = resize_image(image)
 
         # Encode image
@@ -155,17 +242,9 @@ def search_by_image():
             results = results[:top_k]
 
         # Format results
-        formatted_results = []
-        for result in results:
-            formatted_results.append({
-                'image_id': result['image_id'],
-                'image_path': convert_image_path_to_url(result['image_path']),
-                'score': round(result['score'] * 100, 2),
-                'filename': result['metadata'].get('filename', ''),
-                'metadata': result['metadata']
-            })
+        formatted_results = format_results(results)
 
-        return jsonify({
+        return json_response({
             'success': True,
             'search_type': 'image',
             'total_results': len(formatted_results),
@@ -173,7 +252,7 @@ def search_by_image():
         })
 
     except Exception as e:
-        print(f"Error in image search: {str(e)}")
+        logger.exception("Error in image search: %s", e)
         return jsonify({'error': str(e)}), 500
 
 
@@ -201,15 +280,16 @@ def search_multimodal():
 
         # Load image
         file = request.files['image']
-        image_bytes = file.read()
-        image = load_image(image_bytes)
+        image = load_image(file.stream, max_size=MAX_IMAGE_SIZE)
         image = resize_image(image)
 
         # Enhance query
         enhanced_query = enhance_query(query)
 
-        # Encode multimodal query
-        query_vector = clip_model.encode_multimodal(enhanced_query, image, alpha=alpha)
+        # Encode multimodal query (text embedding comes from the query cache;
+        # the image is encoded and fused with it on the model device)
+        text_vector = _encode_text_query(query, enhanced_query)
+        query_vector = clip_model.encode_multimodal(text_vector, image, alpha=alpha)
 
         # Search in FAISS
         retrieve_k = config.FAISS_RETRIEVE_K if config.ENABLE_RERANK else top_k
@@ -224,17 +304,9 @@ def search_multimodal():
             feedback_manager.update_query_stats(f"[multimodal] {query}", results[0]['score'])
 
         # Format results
-        formatted_results = []
-        for result in results:
-            formatted_results.append({
-                'image_id': result['image_id'],
-                'image_path': convert_image_path_to_url(result['image_path']),
-                'score': round(result['score'] * 100, 2),
-                'filename': result['metadata'].get('filename', ''),
-                'metadata': result['metadata']
-            })
+        formatted_results = format_results(results)
 
-        return jsonify({
+        return json_response({
             'success': True,
             'search_type': 'multimodal',
             'query': query,
@@ -245,7 +317,7 @@ def search_multimodal():
         })
 
     except Exception as e:
-        print(f"Error in multimodal search: {str(e)}")
+        logger.exception("Error in multimodal search: %s", e)
         return jsonify({'error': str(e)}), 500
 
 
@@ -263,7 +335,7 @@ def get_search_stats():
         })
 
     except Exception as e:
-        print(f"Error getting stats: {str(e)}")
+        logger.exception("Error getting stats: %s", e)
         return jsonify({'error': str(e)}), 500
 
 
@@ -292,12 +364,12 @@ def search_by_voice():
         # Enhance query if requested
         if enhance:
             enhanced_query = enhance_query(query)
-            print(f"Voice query: '{query}' -> Enhanced: '{enhanced_query}'")
+            logger.info("Voice query: '%s' -> Enhanced: '%s'", query, enhanced_query)
         else:
             enhanced_query = query
 
         # Encode query
-        query_vector = clip_model.encode_text(enhanced_query)[0]
+        query_vector = _encode_text_query(query, enhanced_query)
 
         # Search in FAISS
         retrieve_k = config.FAISS_RETRIEVE_K if config.ENABLE_RERANK else top_k
@@ -305,24 +377,16 @@ def search_by_voice():
 
         # Rerank if enabled
         if config.ENABLE_RERANK and len(results) > top_k:
-            results = rerank_results(results, query)[:top_k]
+            results = rerank_results(results, query, top_k=top_k)
 
         # Update query stats
         if results:
             feedback_manager.update_query_stats(f"[voice] {query}", results[0]['score'])
 
         # Format results
-        formatted_results = []
-        for result in results:
-            formatted_results.append({
-                'image_id': result['image_id'],
-                'image_path': convert_image_path_to_url(result['image_path']),
-                'score': round(result['score'] * 100, 2),
-                'filename': result['metadata'].get('filename', ''),
-                'metadata': result['metadata']
-            })
+        formatted_results = format_results(results)
 
-        return jsonify({
+        return json_response({
             'success': True,
             'search_type': 'voice',
             'query': query,
@@ -332,7 +396,7 @@ def search_by_voice():
         })
 
     except Exception as e:
-        print(f"Error in voice search: {str(e)}")
+        logger.exception("Error in voice search: %s", e)
         return jsonify({'error': str(e)}), 500
 
 
@@ -357,25 +421,20 @@ def search_multi_image():
 
         top_k = int(request.form.get('top_k', config.DEFAULT_TOP_K))
 
-        # Load and process all images
-        images = []
-        for file in files:
-            if file.filename == '':
-                continue
-            image_bytes = file.read()
-            image = load_image(image_bytes)
-            image = resize_image(image)
-            images.append(image)
+        # Load and process all images in parallel
+        image_streams = [file.stream for file in files if file.filename != '']
+        images = list(preprocess_pool.map(_decode_and_resize, image_streams))
 
         if len(images) == 0:
             return jsonify({'error': 'No valid images provided'}), 400
 
-        # Encode all images
+        # Encode all images in one batch
         image_vectors = clip_model.encode_image(images)
 
-        # Average and normalize
-        query_vector = np.mean(image_vectors, axis=0)
-        query_vector = query_vector / np.linalg.norm(query_vector)
+        # Average and normalize (the mean's 1/n cancels out in normalization,
+        # so sum and scale in place)
+        query_vector = image_vectors.sum(axis=0, dtype=np.float32)
+        query_vector /= np.sqrt(query_vector @ query_vector)
 
         # Search in FAISS
         retrieve_k = config.FAISS_RETRIEVE_K if config.ENABLE_RERANK else top_k
@@ -383,20 +442,12 @@ def search_multi_image():
 
         # Rerank if enabled
         if config.ENABLE_RERANK and len(results) > top_k:
-            results = rerank_results(results, f"[multi-image:{len(images)}]")[:top_k]
+            results = rerank_results(results, f"[multi-image:{len(images)}]", top_k=top_k)
 
         # Format results
-        formatted_results = []
-        for result in results:
-            formatted_results.append({
-                'image_id': result['image_id'],
-                'image_path': convert_image_path_to_url(result['image_path']),
-                'score': round(result['score'] * 100, 2),
-                'filename': result['metadata'].get('filename', ''),
-                'metadata': result['metadata']
-            })
+        formatted_results = format_results(results)
 
-        return jsonify({
+        return json_response({
             'success': True,
             'search_type': 'multi-image',
             'num_images': len(images),
@@ -405,44 +456,58 @@ def search_multi_image():
         })
 
     except Exception as e:
-        print(f"Error in multi-image search: {str(e)}")
+        logger.exception("Error in multi-image search: %s", e)
         return jsonify({'error': str(e)}), 500
 
 
-def rerank_results(results, query):
+def rerank_results(results, query, top_k=None):
     """
     Rerank results based on similarity score and user feedback.
 
     Args:
         results: List of search results
         query: Search query for tracking
+        top_k: Number of top results to keep (default: all)
 
     Returns:
         Reranked results
     """
-    reranked = []
-    for result in results:
-        # Get feedback stats for this image
-        feedback_stats = feedback_manager.get_feedback_stats(result['image_id'])
-
-        # Calculate combined score
-        combined_score = calculate_combined_score(
-            result['score'],
-            feedback_stats,
-            alpha=0.8  # 80% similarity, 20% feedback
-        )
-
-        # Add to reranked list
-        reranked.append({
-            **result,
-            'combined_score': combined_score,
-            'feedback_stats': feedback_stats
-        })
+    if not results:
+        return []
+
+    # Get feedback stats for all results with one query
+    image_ids = [result['image_id'] for result in results]
+    feedback_counts = feedback_manager.get_feedback_stats_bulk(image_ids)
+    similarity_scores = np.fromiter((result['score'] for result in results), dtype=np.float64, count=len(results))
+
+    # Calculate combined scores
+    combined_scores = calculate_combined_scores(
+        similarity_scores,
+        feedback_counts,
+        alpha=0.8  # 80% similarity, 20% feedback
+    )
+
+    # Select top_k with a partial sort, then order only those
+    # (ties keep similarity order)
+    if top_k is not None and top_k < len(results):
+        order = np.argpartition(-combined_scores, top_k - 1)[:top_k]
+        order = order[np.lexsort((order, -combined_scores[order]))]
+    else:
+        order = np.argsort(-combined_scores, kind='stable')
+
+    return [
+        {
+            **results[i],
+            'combined_score': float(combined_scores[i]),
+            'feedback_stats': dict(zip(FEEDBACK_TYPES, feedback_counts[i].tolist()))
+        }
+        for i in order
+    ]
 
-    # Sort by combined score
-    reranked.sort(key=lambda x: x['combined_score'], reverse=True)
 
-    return reranked
+def _is_image_id(value):
+    """Whether a JSON value is a valid image_id (an integer, not a bool)."""
+    return isinstance(value, int) and not isinstance(value, bool)
 
 
 @search_bp.route('/feedback/record', methods=['POST'])
@@ -466,6 +531,9 @@ def record_feedback():
         if image_id is None:
             return jsonify({'error': 'image_id is required'}), 400
 
+        if not _is_image_id(image_id):
+            return jsonify({'error': 'image_id must be an integer'}), 400
+
         if feedback_type not in ['like', 'favorite', 'irrelevant']:
             return jsonify({'error': 'Invalid feedback_type'}), 400
 
@@ -485,7 +553,54 @@ def record_feedback():
             return jsonify({'error': 'Failed to record feedback'}), 500
 
     except Exception as e:
-        print(f"Error recording feedback: {str(e)}")
+        logger.exception("Error recording feedback: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+
+@search_bp.route('/feedback/record-batch', methods=['POST'])
+def record_feedback_batch():
+    """
+    Record several feedback entries in one request (one database transaction).
+
+    Request body:
+        {
+            "feedback": [
+                {"query": "search query", "image_id": 123, "feedback_type": "like"},
+                ...
+            ]
+        }
+    """
+    try:
+        data = request.get_json()
+        entries = data.get('feedback')
+
+        if not isinstance(entries, list) or not entries:
+            return jsonify({'error': 'feedback must be a non-empty list'}), 400
+
+        rows = []
+        for i, entry in enumerate(entries):
+            if not isinstance(entry, dict):
+                return jsonify({'error': f'feedback[{i}] must be an object'}), 400
+            if entry.get('image_id') is None:
+                return jsonify({'error': f'feedback[{i}]: image_id is required'}), 400
+            if not _is_image_id(entry['image_id']):
+                return jsonify({'error': f'feedback[{i}]: image_id must be an integer'}), 400
+            if not isinstance(entry.get('query', ''), str):
+                return jsonify({'error': f'feedback[{i}]: query must be a string'}), 400
+            if entry.get('feedback_type') not in FEEDBACK_TYPES:
+                return jsonify({'error': f'feedback[{i}]: Invalid feedback_type'}), 400
+            rows.append((entry.get('query', ''), entry['image_id'], entry['feedback_type'], None))
+
+        recorded = feedback_manager.record_feedback_bulk(rows)
+
+        return jsonify({
+            'success': True,
+            'recorded': recorded,
+            'message': 'Feedback recorded'
+        })
+
+    except Exception as e:
+        logger.exception("Error recording feedback batch: %s", e)
         return jsonify({'error': str(e)}), 500
 
 
@@ -501,7 +616,7 @@ def get_feedback_stats_endpoint(image_id):
         })
 
     except Exception as e:
-        print(f"Error getting feedback stats: {str(e)}")
+        logger.exception("Error getting feedback stats: %s", e)
         return jsonify({'error': str(e)}), 500
 
 
@@ -513,16 +628,12 @@ def get_top_rated():
         top_rated = feedback_manager.get_top_rated_images(limit=limit)
 
         # Add image paths to the results
-        metadata = faiss_index.metadata
+        # image_id in feedback is 1-based, but metadata index is 0-based
+        image_paths = faiss_index.get_image_paths([item['image_id'] - 1 for item in top_rated])
         enriched_results = []
 
-        for item in top_rated:
-            image_id = item['image_id']
-            # image_id in feedback is 1-based, but metadata index is 0-based
-            metadata_index = image_id - 1
-
-            if 0 <= metadata_index < len(metadata['image_paths']):
-                image_path = metadata['image_paths'][metadata_index]
+        for item, image_path in zip(top_rated, image_paths):
+            if image_path is not None:
                 image_url = convert_image_path_to_url(image_path)
                 filename = os.path.basename(image_path)
 
@@ -542,5 +653,5 @@ def get_top_rated():
         })
 
     except Exception as e:
-        print(f"Error getting top-rated images: {str(e)}")
+        logger.exception("Error getting top-rated images: %s", e)
         return jsonify({'error': str(e)}), 500
@@ -2,15 +2,44 @@
 API Utility Functions
 """
 
+import uuid
 from pathlib import Path
+import numpy as np
+import orjson
+from flask import current_app
 from werkzeug.utils import secure_filename
 import config
 
 
+# Normalized once at import instead of per call
+_ALLOWED_EXTENSIONS = frozenset(ext.lower() for ext in config.ALLOWED_EXTENSIONS)
+
+
 def allowed_file(filename):
     """Check if file extension is allowed."""
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in config.ALLOWED_EXTENSIONS
+    dot = filename.rfind('.')
+    return dot >= 0 and filename[dot + 1:].lower() in _ALLOWED_EXTENSIONS
+
+
+def json_response(payload, status=200):
+    """
+    Build a JSON response serialized with orjson.
+
+    Faster than jsonify for large result lists and serializes NumPy
+    scalars/arrays natively.
+
+    Args:
+        payload: JSON-serializable object
+        status: HTTP status code
+
+    Returns:
+        Flask Response
+    """
+    return current_app.response_class(
+        orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY),
+        status=status,
+        mimetype='application/json'
+    )
 
 
 def save_upload(file, directory=None):
@@ -34,44 +63,36 @@ def save_upload(file, directory=None):
     save_dir = directory or config.UPLOADS_DIR
     save_dir.mkdir(parents=True, exist_ok=True)
 
-    filepath = save_dir / filename
-
-    # Handle duplicate filenames
-    counter = 1
-    while filepath.exists():
-        name, ext = filename.rsplit('.', 1)
-        filepath = save_dir / f"{name}_{counter}.{ext}"
-        counter += 1
+    # Add a random suffix so names never collide (no exists() probing)
+    name = Path(filename)
+    filepath = save_dir / f"{name.stem}_{uuid.uuid4().hex[:8]}{name.suffix}"
 
     file.save(str(filepath))
     return filepath
 
 
-def calculate_combined_score(similarity_score, feedback_stats, alpha=0.8):
+def calculate_combined_scores(similarity_scores, feedback_counts, alpha=0.8):
     """
-    Calculate combined score from similarity and feedback.
+    Calculate combined scores from similarity and feedback for many results.
 
     Args:
-        similarity_score: FAISS similarity score (0-1)
-        feedback_stats: Dict with 'like', 'favorite', 'irrelevant' counts
+        similarity_scores: Array of FAISS similarity scores (0-1), shape (N,)
+        feedback_counts: Array of like/favorite/irrelevant counts, shape (N, 3)
         alpha: Weight for similarity (1-alpha for feedback)
 
     Returns:
-        Combined score (0-1)
+        Array of combined scores (0-1), shape (N,)
     """
-    # Calculate feedback score
-    likes = feedback_stats.get('like', 0)
-    favorites = feedback_stats.get('favorite', 0)
-    irrelevant = feedback_stats.get('irrelevant', 0)
-
-    total_feedback = likes + favorites + irrelevant
-    if total_feedback == 0:
-        feedback_score = 0.5  # Neutral if no feedback
-    else:
-        # Favorites worth 2x likes
-        positive = likes + (favorites * 2)
-        feedback_score = positive / (total_feedback + favorites)
+    # Calculate feedback scores
+    likes = feedback_counts[:, 0]
+    favorites = feedback_counts[:, 1]
+    total_feedback = feedback_counts.sum(axis=1)
+
+    # Favorites worth 2x likes; neutral 0.5 if no feedback
+    positive = likes + (favorites * 2)
+    feedback_scores = np.full(len(feedback_counts), 0.5)
+    np.divide(positive, total_feedback + favorites, out=feedback_scores, where=total_feedback > 0)
 
     # Combine scores
-    combined = (similarity_score * alpha) + (feedback_score * (1 - alpha))
+    combined = (similarity_scores * alpha) + (feedback_scores * (1 - alpha))
     return combined
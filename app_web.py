@@ -5,10 +5,15 @@ Complete web UI with text, image, voice, and multimodal search capabilities
 
 import os
 import uuid
+import atexit
+import signal
+import sys
+import queue
 from flask import Flask, render_template, request, jsonify, send_from_directory
 from flask_cors import CORS
 from pathlib import Path
 import logging
+from logging.handlers import QueueHandler, QueueListener
 
 import config
 from core.clip_model import CLIPModelWrapper
@@ -16,11 +21,18 @@ from core.faiss_index import FAISSIndexManager
 from core.feedback import FeedbackManager
 from api.search import search_bp, init_search_api
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Configure logging: request threads only enqueue records, a background
+# listener thread writes them to the stream
+log_queue = queue.Queue(-1)
+stream_handler = logging.StreamHandler()
+stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+log_listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+log_listener.start()
+atexit.register(log_listener.stop)
+
+queue_handler = QueueHandler(log_queue)
+queue_handler.setFormatter(logging.Formatter('%(message)s'))
+logging.basicConfig(level=logging.INFO, handlers=[queue_handler])
 logger = logging.getLogger(__name__)
 
 def create_app():
@@ -45,6 +57,7 @@ def create_app():
         clip_model = CLIPModelWrapper()
         faiss_index = FAISSIndexManager()
         feedback_manager = FeedbackManager()
+        atexit.register(feedback_manager.close)
 
         # Load FAISS index and metadata
         logger.info("Loading FAISS index...")
@@ -146,5 +159,7 @@ def create_app():
 
 if __name__ == '__main__':
     app = create_app()
+    # SIGTERM (stop.sh) exits via SystemExit so atexit hooks flush buffered stats
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     logger.info(f"Starting Flask app on http://localhost:5001")
     app.run(host='0.0.0.0', port=5001, debug=config.DEBUG)
@@ -1,46 +1,79 @@
 """
-从embeddings生成FAISS索引
-用法: python build_faiss_index.py
+从embeddings生成FAISS索引（已有索引时只追加新图片）
+用法: python build_faiss_index.py [--rebuild]
 """
 
-import pickle
+import argparse
+import json
 import numpy as np
 from pathlib import Path
+import config
 from core.faiss_index import FAISSIndexManager
 
-def build_faiss_index():
-    """从image_embeddings.pkl构建FAISS索引"""
+def index_exists():
+    """索引文件和元数据文件是否都已存在"""
+    metadata_exists = config.METADATA_PATH.exists() or config.LEGACY_METADATA_PATH.exists()
+    return config.FAISS_INDEX_PATH.exists() and metadata_exists
+
+def build_faiss_index(rebuild=False):
+    """从image_embeddings.npy构建FAISS索引；已有索引且不要求重建时，增量添加新图片"""
 
     # 加载embeddings
-    embeddings_file = "image_embeddings.pkl"
+    embeddings_file = "image_embeddings.npy"
+    paths_file = "image_paths.json"
 
-    if not Path(embeddings_file).exists():
-        print(f"❌ 未找到 {embeddings_file}")
+    if not Path(embeddings_file).exists() or not Path(paths_file).exists():
+        print(f"❌ 未找到 {embeddings_file} 或 {paths_file}")
         print("请先运行: python get_embeddings.py")
         return
 
     print(f"📂 加载embeddings: {embeddings_file}")
-    with open(embeddings_file, 'rb') as f:
-        data = pickle.load(f)
-
-    embeddings = data['embeddings']
-    image_paths = data['image_paths']
+    # mmap加载：按需从页缓存读取，无需整体反序列化
+    embeddings = np.load(embeddings_file, mmap_mode='r')
+    with open(paths_file, 'r', encoding='utf-8') as f:
+        paths_data = json.load(f)
+    image_paths = paths_data['image_paths']
+    # 生成embeddings所用的模型，随索引一起保存
+    model_info = {key: paths_data.get(key) for key in ('model_name', 'pretrained')}
 
     print(f"✅ 加载了 {len(image_paths)} 张图片的embeddings")
     print(f"📦 Embedding维度: {embeddings.shape}")
 
-    # 创建元数据
-    metadata_list = []
-    for path in image_paths:
-        metadata_list.append({
-            'filename': Path(path).name,
-            'path': str(path)
-        })
-
-    # 建立FAISS索引
-    print("\n🔄 构建FAISS索引...")
     faiss_manager = FAISSIndexManager()
-    faiss_manager.build_index(embeddings.astype('float32'), image_paths, metadata_list)
+
+    if not rebuild and index_exists():
+        # 增量更新：只添加索引中还没有的图片，避免重新训练IVF/HNSW等结构
+        print("\n🔄 加载已有FAISS索引...")
+        faiss_manager.load_index()
+
+        if faiss_manager.dimension != embeddings.shape[1]:
+            print(f"⚠️  索引维度 {faiss_manager.dimension} 与embeddings维度 {embeddings.shape[1]} 不一致，重新构建")
+            rebuild = True
+        elif faiss_manager.model_info != model_info:
+            # 同维度的不同模型/权重（如ViT-B-16）向量空间不同，不能混在一个索引里
+            print(f"⚠️  索引的模型 {faiss_manager.model_info or '未知'} 与embeddings的模型 {model_info} 不一致，重新构建")
+            rebuild = True
+        elif faiss_manager.index_settings != faiss_manager.configured_index_settings():
+            # config中更换了索引类型/量化方式，追加到旧结构的索引里不会生效
+            print(f"⚠️  索引的构建设置 {faiss_manager.index_settings or '未知'} 与config中的 "
+                  f"{faiss_manager.configured_index_settings()} 不一致，重新构建")
+            rebuild = True
+        else:
+            existing = set(faiss_manager.get_image_paths(list(range(faiss_manager.num_images))))
+            new_mask = np.array([path not in existing for path in image_paths], dtype=bool)
+
+            if not new_mask.any():
+                print("✅ 没有新图片，索引已是最新")
+                return
+
+            new_paths = [path for path, is_new in zip(image_paths, new_mask) if is_new]
+            print(f"➕ 添加 {len(new_paths)} 张新图片...")
+            faiss_manager.add_vectors(embeddings[new_mask], new_paths)
+
+    if rebuild or faiss_manager.index is None:
+        # 建立FAISS索引
+        print("\n🔄 构建FAISS索引...")
+        faiss_manager.build_index(embeddings, image_paths, model_info)
 
     # 保存索引
     print("\n💾 保存FAISS索引...")
@@ -55,4 +88,7 @@ def build_faiss_index():
     print("\n🚀 现在可以运行 python app_web.py 来启动Flask应用")
 
 if __name__ == "__main__":
-    build_faiss_index()
+    parser = argparse.ArgumentParser(description="从embeddings生成FAISS索引")
+    parser.add_argument("--rebuild", action="store_true", help="丢弃已有索引，全部重新构建")
+    args = parser.parse_args()
+    build_faiss_index(rebuild=args.rebuild)
@@ -1,4 +1,6 @@
 import os
+import contextlib
+import functools
 from pathlib import Path
 
 # Base paths
@@ -14,16 +16,48 @@ UPLOADS_DIR = STATIC_DIR / "uploads"
 # FAISS index paths
 FAISS_DIR = DATA_DIR / "faiss_index"
 FAISS_INDEX_PATH = FAISS_DIR / "index.faiss"
-METADATA_PATH = FAISS_DIR / "metadata.json"
+METADATA_PATH = FAISS_DIR / "metadata.sqlite"
+LEGACY_METADATA_PATH = FAISS_DIR / "metadata.json"  # Read if metadata.sqlite is missing
+
+# FAISS index type:
+#   "flat"  - exact, small-scale <10K images
+#   "ivf"   - inverted lists, approximate, for large collections
+#   "hnsw"  - graph search, ~O(log N) per query, 100K+ images
+#   "ivfpq" - inverted lists + product quantization, >500K images / low memory
+FAISS_INDEX_TYPE = "flat"
+# Vector storage: "none" (float32), "fp16" (half the bytes scanned per query)
+# or "int8" (a quarter); negligible recall loss for normalized CLIP vectors.
+# Not used by "ivfpq", which has its own compression.
+FAISS_QUANT = "none"
+FAISS_IVF_NPROBE = 16  # Inverted lists scanned per query for "ivf"
+FAISS_HNSW_M = 32  # Graph neighbors per node for "hnsw"
+FAISS_HNSW_EF_CONSTRUCTION = 200
+FAISS_HNSW_EF_SEARCH = 64  # Minimum; queries use max(4 * top_k, this)
+FAISS_PQ_M = 64  # Sub-quantizers for "ivfpq" (must divide the embedding dimension)
+FAISS_IVF_PARALLEL_MODE = 1  # 1 = parallelize over inverted lists within a single query
+# Serve the loaded index from GPU 0 on CUDA hosts (requires faiss-gpu; HNSW stays on CPU)
+FAISS_USE_GPU = True
+# FAISS OpenMP threads (0 = FAISS default, all cores). Set to 1 when running
+# several server workers so they parallelize across requests instead.
+FAISS_OMP_THREADS = int(os.environ.get('FAISS_OMP_THREADS', 0))
 
 # Database
 FEEDBACK_DB_PATH = DATA_DIR / "feedback.db"
+POPULAR_QUERIES_CACHE_TTL = 60  # Seconds get_popular_queries results are reused
+# Query stats are buffered in memory and written in one batch after this many
+# searches or this many seconds, whichever comes first
+QUERY_STATS_FLUSH_COUNT = 500
+QUERY_STATS_FLUSH_INTERVAL = 5.0
 
 # CLIP model settings
 CLIP_MODEL_NAME = "ViT-B-32"
 # 使用本地模型文件（LAION训练版本，性能更好）
 CLIP_PRETRAINED = "./models/ViT-B-32-laion2B-s34B-b79K/open_clip_pytorch_model.bin"
 
+# OpenMP threads sleep instead of busy-spinning between requests.
+# Must be set before torch/faiss initialize the OpenMP runtime.
+os.environ.setdefault('OMP_WAIT_POLICY', 'PASSIVE')
+
 # Device settings - prioritize MPS > CUDA > CPU
 import torch
 if torch.backends.mps.is_available():
@@ -33,12 +67,52 @@ elif torch.cuda.is_available():
 else:
     DEVICE = "cpu"
 
+# Run CLIP in half precision on CUDA (tensor cores, half the activation bandwidth)
+CLIP_HALF_PRECISION = DEVICE == "cuda"
+# Autocast dtype for CLIP forward passes (None = off; ignored on MPS).
+# e.g. torch.bfloat16 on CPUs with AVX512-BF16/AMX, torch.float16 on CUDA
+# when CLIP_HALF_PRECISION is off. Elsewhere bf16 autocast is slower than fp32.
+CLIP_AUTOCAST_DTYPE = None
+
+# Device-dependent objects resolved once, so encode paths need no device checks
+DEVICE_TORCH = torch.device(DEVICE)
+PIN_MEMORY = DEVICE == "cuda"  # Pinned host batches allow async host-to-device copies
+if CLIP_AUTOCAST_DTYPE is not None and DEVICE != "mps":
+    AUTOCAST_CTX = functools.partial(torch.autocast, device_type=DEVICE, dtype=CLIP_AUTOCAST_DTYPE)
+else:
+    AUTOCAST_CTX = contextlib.nullcontext
+# torch.compile the vision and text towers (CUDA only; compiled on first use).
+# Not "reduce-overhead": its CUDA graphs are recorded per thread and per batch
+# size, and the threaded server serves each request on a new thread with
+# varying batch sizes, so graphs would be re-recorded on every request.
+CLIP_COMPILE = DEVICE == "cuda"
+CLIP_COMPILE_MODE = "default"
+
 # Search settings
 DEFAULT_TOP_K = 20
 FAISS_RETRIEVE_K = 100  # Retrieve top 100 for reranking
 ENABLE_RERANK = True
+ENABLE_WARMUP = True  # Dummy encode + search at startup to avoid a slow first query
+
+# Encode enhanced (simple English) queries as the average of several prompt
+# templates ("a photo of X", "a picture of X", ...) in one batched forward pass
+ENABLE_PROMPT_ENSEMBLE = True
+
+# Micro-batch concurrent text queries into one CLIP forward pass
+ENABLE_TEXT_BATCHING = True
+TEXT_BATCH_MAX_SIZE = 32
+TEXT_BATCH_MAX_WAIT_MS = 5  # Max time the first query in a batch waits for others
+
+# Cache settings
+TEXT_EMBEDDING_CACHE_SIZE = 1024  # Cached text query embeddings (~2KB each at d=512)
+# Reuse results of near-duplicate text queries. Hits return the cached query's
+# results and scores as-is (they are not rescored against the new query).
+ENABLE_SEMANTIC_CACHE = False
+SEMANTIC_CACHE_SIZE = 256
+SEMANTIC_CACHE_THRESHOLD = 0.98  # Minimum cosine similarity for a cache hit
 
 # API settings
+IMAGE_PREPROCESS_WORKERS = 8  # Threads for decoding/resizing uploaded images
 MAX_UPLOAD_SIZE = 10 * 1024 * 1024  # 10MB
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp'}
 
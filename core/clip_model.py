@@ -1,10 +1,17 @@
 import torch
+import torch.nn.functional as F
 import open_clip
 from PIL import Image
 import numpy as np
 from typing import Union, List
 import config
 
+try:
+    # Optional: CLIP-specialized BPE tokenizer, much faster than open_clip's
+    from instant_clip_tokenizer import Tokenizer as InstantTokenizer
+except ImportError:
+    InstantTokenizer = None
+
 
 class CLIPModelWrapper:
     """
@@ -26,76 +33,192 @@ class CLIPModelWrapper:
 
         print(f"Loading CLIP model on device: {config.DEVICE}")
         self.device = config.DEVICE
+        self.torch_device = config.DEVICE_TORCH
 
         # Load CLIP model
         self.model, _, self.preprocess = open_clip.create_model_and_transforms(
             config.CLIP_MODEL_NAME,
             pretrained=config.CLIP_PRETRAINED
         )
-        self.model = self.model.to(self.device)
+        self.model = self.model.to(self.torch_device)
+        if config.CLIP_HALF_PRECISION:
+            self.model = self.model.half()
         self.model.eval()
+        self.dtype = next(self.model.parameters()).dtype
+
+        if config.CLIP_COMPILE and self.device == "cuda":
+            self._compile_model()
 
         # Load tokenizer
         self.tokenizer = open_clip.get_tokenizer(config.CLIP_MODEL_NAME)
 
+        # Use instant-clip-tokenizer when installed and the model uses the standard CLIP BPE vocab
+        # (with plain truncation; reduction masks only exist in open_clip)
+        self.fast_tokenizer = None
+        if (
+            InstantTokenizer is not None
+            and isinstance(self.tokenizer, open_clip.tokenizer.SimpleTokenizer)
+            and self.tokenizer.reduction_fn is None
+        ):
+            self.fast_tokenizer = InstantTokenizer()
+
         self._initialized = True
         print("CLIP model loaded successfully")
 
-    @torch.no_grad()
-    def encode_text(self, text: Union[str, List[str]]) -> np.ndarray:
+    def _compile_model(self):
+        """torch.compile the vision and text transformers, keeping eager mode if unavailable."""
+        try:
+            self.model.visual = torch.compile(self.model.visual, mode=config.CLIP_COMPILE_MODE)
+            if hasattr(self.model, "transformer"):  # CustomTextCLIP keeps its text tower elsewhere
+                self.model.transformer = torch.compile(self.model.transformer, mode=config.CLIP_COMPILE_MODE)
+        except Exception as e:
+            print(f"torch.compile unavailable, using eager mode: {e}")
+
+    @torch.inference_mode()
+    def encode_text(
+        self,
+        text: Union[str, List[str]],
+        return_numpy: bool = True
+    ) -> Union[np.ndarray, torch.Tensor]:
         """
         Encode text to feature vector(s).
 
         Args:
             text: Single text string or list of text strings
+            return_numpy: Return a float32 numpy array (default) or the
+                float32 tensor left on the model device
 
         Returns:
-            Normalized feature vector(s) as numpy array
+            Normalized feature vector(s), shape (N, D)
         """
         if isinstance(text, str):
             text = [text]
 
+        text_features = self._text_features(text)
+        return self._to_numpy(text_features) if return_numpy else text_features
+
+    def _text_features(self, texts: List[str]) -> torch.Tensor:
+        """
+        Encode texts, keeping the features on the model device.
+
+        Args:
+            texts: List of text strings
+
+        Returns:
+            Normalized float32 feature tensor of shape (N, D)
+        """
         # Tokenize
-        text_tokens = self.tokenizer(text).to(self.device)
+        text_tokens = self.tokenize(texts).to(self.torch_device)
 
-        # Encode
-        text_features = self.model.encode_text(text_tokens)
+        # Encode (features back to float32 for normalization and numpy)
+        with config.AUTOCAST_CTX():
+            text_features = self.model.encode_text(text_tokens)
+        text_features = text_features.float()
 
         # Normalize
-        text_features = text_features / text_features.norm(dim=-1, keepdim=True)
+        text_features = F.normalize(text_features, dim=-1)
+
+        return text_features
+
+    @staticmethod
+    def _to_numpy(features: torch.Tensor) -> np.ndarray:
+        """Copy a feature tensor to host memory as a numpy array."""
+        return features.cpu().numpy()
+
+    def warmup(self):
+        """
+        Run dummy text and image encodes so the first real query does not pay
+        for lazy initialization (kernel selection/JIT, allocator warmup).
+        """
+        self.encode_text("warmup")
+        self.encode_image(Image.new('RGB', (224, 224)))
+
+        if self.device == "cuda":
+            torch.cuda.synchronize()
+
+    def tokenize(self, texts: List[str]) -> torch.Tensor:
+        """
+        Tokenize texts into a (N, context_length) token tensor.
+
+        Args:
+            texts: List of text strings
 
-        return text_features.cpu().numpy()
+        Returns:
+            LongTensor of token ids on CPU
+        """
+        if self.fast_tokenizer is not None:
+            # Same text cleanup as open_clip (ftfy, HTML unescape, whitespace,
+            # lowercase), so tokens match those the index was built with
+            texts = [self.tokenizer.clean_fn(text) for text in texts]
+            tokens = self.fast_tokenizer.tokenize_batch(texts, self.tokenizer.context_length)
+            return torch.from_numpy(tokens.astype(np.int64))
+
+        return self.tokenizer(texts)
 
-    @torch.no_grad()
-    def encode_image(self, image: Union[Image.Image, List[Image.Image]]) -> np.ndarray:
+    @torch.inference_mode()
+    def encode_image(
+        self,
+        image: Union[Image.Image, List[Image.Image]],
+        return_numpy: bool = True
+    ) -> Union[np.ndarray, torch.Tensor]:
         """
         Encode image(s) to feature vector(s).
 
         Args:
             image: Single PIL Image or list of PIL Images
+            return_numpy: Return a float32 numpy array (default) or the
+                float32 tensor left on the model device
 
         Returns:
-            Normalized feature vector(s) as numpy array
+            Normalized feature vector(s), shape (N, D)
         """
         if isinstance(image, Image.Image):
             image = [image]
 
-        # Preprocess
-        image_tensors = torch.stack([self.preprocess(img) for img in image])
-        image_tensors = image_tensors.to(self.device)
+        image_features = self._image_features(self._preprocess_images(image))
+        return self._to_numpy(image_features) if return_numpy else image_features
+
+    def _preprocess_images(self, images: List[Image.Image]) -> torch.Tensor:
+        """
+        Preprocess images into a CPU batch tensor (pinned on CUDA for async copy).
 
-        # Encode
-        image_features = self.model.encode_image(image_tensors)
+        Args:
+            images: List of PIL Images
+
+        Returns:
+            Tensor of shape (N, 3, H, W)
+        """
+        image_tensors = torch.stack([self.preprocess(img) for img in images])
+        if config.PIN_MEMORY:
+            image_tensors = image_tensors.pin_memory()
+        return image_tensors
+
+    def _image_features(self, image_tensors: torch.Tensor) -> torch.Tensor:
+        """
+        Encode a preprocessed image batch, keeping the features on the model device.
+
+        Args:
+            image_tensors: Tensor from _preprocess_images
+
+        Returns:
+            Normalized float32 feature tensor of shape (N, D)
+        """
+        image_tensors = image_tensors.to(self.torch_device, dtype=self.dtype, non_blocking=True)
+
+        # Encode (features back to float32 for normalization and numpy)
+        with config.AUTOCAST_CTX():
+            image_features = self.model.encode_image(image_tensors)
+        image_features = image_features.float()
 
         # Normalize
-        image_features = image_features / image_features.norm(dim=-1, keepdim=True)
+        image_features = F.normalize(image_features, dim=-1)
 
-        return image_features.cpu().numpy()
+        return image_features
 
-    @torch.no_grad()
+    @torch.inference_mode()
     def encode_multimodal(
         self,
-        text: str,
+        text: Union[str, np.ndarray],
         image: Image.Image,
         alpha: float = 0.5
     ) -> np.ndarray:
@@ -103,25 +226,26 @@ class CLIPModelWrapper:
         Encode text and image with weighted fusion.
 
         Args:
-            text: Text query
+            text: Text query, or its precomputed normalized feature vector
+                (e.g. from the text embedding cache)
             image: PIL Image
             alpha: Weight for text (0=pure image, 1=pure text, 0.5=balanced)
 
         Returns:
             Normalized fused feature vector
         """
-        # Encode both modalities
-        text_features = self.encode_text(text)[0]
-        image_features = self.encode_image(image)[0]
-
-        # Weighted fusion
-        combined_features = alpha * text_features + (1 - alpha) * image_features
+        # Encode both modalities and fuse on device (one host copy of the result)
+        if isinstance(text, str):
+            text_features = self._text_features([text])[0]
+        else:
+            text_features = torch.tensor(text, dtype=torch.float32, device=self.torch_device)
+        image_features = self._image_features(self._preprocess_images([image]))[0]
 
-        # Re-normalize
-        combined_features = combined_features / np.linalg.norm(combined_features)
+        combined_features = F.normalize(alpha * text_features + (1 - alpha) * image_features, dim=-1)
 
-        return combined_features
+        return self._to_numpy(combined_features)
 
+    @torch.inference_mode()
     def encode_batch_images(self, images: List[Image.Image], batch_size: int = 32) -> np.ndarray:
         """
         Encode images in batches for efficiency.
@@ -137,7 +261,6 @@ class CLIPModelWrapper:
 
         for i in range(0, len(images), batch_size):
             batch = images[i:i + batch_size]
-            features = self.encode_image(batch)
-            all_features.append(features)
+            all_features.append(self.encode_image(batch))
 
         return np.vstack(all_features)
@@ -1,71 +1,234 @@
 import faiss
 import numpy as np
 import json
+import os
+import sqlite3
+import threading
 from pathlib import Path
 from typing import List, Dict, Tuple, Optional
 import config
 
 
+# config.FAISS_QUANT -> FAISS scalar quantizer type (None = raw float32 vectors)
+SCALAR_QUANTIZER_TYPES = {
+    "none": None,
+    "fp16": faiss.ScalarQuantizer.QT_fp16,
+    "int8": faiss.ScalarQuantizer.QT_8bit,
+}
+
+# Rows converted to float32 per index.add() call, so fp16 / memory-mapped
+# embeddings are never copied to float32 all at once
+ADD_BATCH_SIZE = 65536
+
+# Index training runs on a random sample of at most MAX_TRAIN_POINTS rows, but
+# never fewer than MIN_TRAIN_POINTS_PER_LIST per IVF list (FAISS warns below
+# 39) nor more than it would use itself (256 per list for k-means)
+MAX_TRAIN_POINTS = 65536
+MIN_TRAIN_POINTS_PER_LIST = 39
+MAX_TRAIN_POINTS_PER_LIST = 256
+
+# Max ids per "WHERE id IN (...)" metadata query (SQLite host parameter limit)
+METADATA_QUERY_CHUNK = 900
+SQLITE_HEADER = b"SQLite format 3\x00"
+
+# Keys of the metadata info table that describe the index structure (the rest
+# describe the embedding model)
+INDEX_SETTING_KEYS = ("index_type", "quant")
+
+
 class FAISSIndexManager:
     """
     Manages FAISS index for efficient vector similarity search.
-    Uses IndexFlatIP for exact inner product search (small-scale <10K images).
+    Uses IndexFlatIP for exact inner product search (small-scale <10K images),
+    or IVF / HNSW / IVF-PQ indexes for approximate search on large collections
+    (see config.FAISS_INDEX_TYPE), optionally storing vectors as fp16/int8
+    (see config.FAISS_QUANT).
     """
 
     def __init__(self):
         self.index = None
         self.metadata = {
-            "image_paths": [],
-            "image_ids": [],
-            "metadata": {}
+            "image_paths": []
         }
         self.dimension = None
 
-    def build_index(self, embeddings: np.ndarray, image_paths: List[str], metadata_list: List[Dict] = None):
+        # Embedding model the vectors came from ({"model_name", "pretrained"}),
+        # saved with the metadata so incremental builds can detect a model change
+        self.model_info = {}
+        # config settings the index was built with ({"index_type", "quant"})
+        self.index_settings = {}
+
+        # Read-only connection to the saved metadata.sqlite after load_index();
+        # while set, image paths are looked up on demand instead of held in memory
+        self._metadata_db = None
+        self._metadata_lock = threading.Lock()
+
+        # Set while self.index is a GPU copy (see _move_to_gpu)
+        self._gpu_resources = None
+
+        if config.FAISS_OMP_THREADS > 0:
+            faiss.omp_set_num_threads(config.FAISS_OMP_THREADS)
+
+    def build_index(
+        self,
+        embeddings: np.ndarray,
+        image_paths: List[str],
+        model_info: Optional[Dict] = None
+    ):
         """
         Build FAISS index from embeddings.
 
         Args:
             embeddings: numpy array of shape (N, D) where N is number of images, D is embedding dimension
             image_paths: List of image file paths
-            metadata_list: Optional list of metadata dicts for each image
+            model_info: Embedding model description, e.g. {"model_name": ..., "pretrained": ...}
         """
         assert len(embeddings) == len(image_paths), "Embeddings and paths must have same length"
 
         self.dimension = embeddings.shape[1]
         print(f"Building FAISS index with {len(embeddings)} vectors of dimension {self.dimension}")
 
-        # Use IndexFlatIP for exact inner product search
         # Since CLIP embeddings are normalized, inner product = cosine similarity
-        self.index = faiss.IndexFlatIP(self.dimension)
+        self.index = self._create_index(len(embeddings))
+        self._gpu_resources = None
 
-        # Add vectors to index
-        self.index.add(embeddings.astype('float32'))
+        # Train (no-op for flat / fp16 indexes) and add vectors to index
+        if not self.index.is_trained:
+            self.index.train(self._training_sample(embeddings))
+        self._add_in_batches(embeddings)
+        self._apply_search_params()
 
-        # Store metadata
-        self.metadata["image_paths"] = image_paths
-        self.metadata["image_ids"] = list(range(len(image_paths)))
-
-        if metadata_list:
-            for idx, meta in enumerate(metadata_list):
-                self.metadata["metadata"][str(idx)] = meta
-        else:
-            for idx, path in enumerate(image_paths):
-                self.metadata["metadata"][str(idx)] = {
-                    "filename": Path(path).name,
-                    "path": str(path)
-                }
+        # Store metadata (per-image filename/path are derived from image_paths on demand)
+        self._close_metadata_db()
+        self.metadata["image_paths"] = [str(path) for path in image_paths]
+        self.model_info = dict(model_info or {})
+        self.index_settings = self.configured_index_settings()
 
         print(f"FAISS index built successfully with {self.index.ntotal} vectors")
 
-    def add_vectors(self, embeddings: np.ndarray, image_paths: List[str], metadata_list: List[Dict] = None):
+    @staticmethod
+    def configured_index_settings() -> Dict[str, str]:
+        """Index structure settings currently selected in config."""
+        return {"index_type": config.FAISS_INDEX_TYPE, "quant": config.FAISS_QUANT}
+
+    def _training_sample(self, embeddings: np.ndarray) -> np.ndarray:
+        """
+        Pick a bounded random subset of the embeddings for index training.
+
+        Args:
+            embeddings: numpy array of shape (N, D), any float dtype (e.g. fp16 memmap)
+
+        Returns:
+            float32 array of the sampled rows (all rows for small collections)
+        """
+        max_points = MAX_TRAIN_POINTS
+        ivf = faiss.try_extract_index_ivf(self.index)
+        if ivf is not None:
+            max_points = min(
+                max(max_points, MIN_TRAIN_POINTS_PER_LIST * ivf.nlist),
+                MAX_TRAIN_POINTS_PER_LIST * ivf.nlist
+            )
+
+        if len(embeddings) > max_points:
+            # Fixed seed keeps rebuilds reproducible; sorted ids read a memmap in order
+            rows = np.sort(np.random.default_rng(0).choice(len(embeddings), max_points, replace=False))
+            embeddings = embeddings[rows]
+        return np.ascontiguousarray(embeddings, dtype=np.float32)
+
+    def _add_in_batches(self, embeddings: np.ndarray):
+        """
+        Add vectors to the index, converting to float32 one batch at a time.
+
+        Args:
+            embeddings: numpy array of shape (N, D), any float dtype (e.g. fp16 memmap)
+        """
+        for start in range(0, len(embeddings), ADD_BATCH_SIZE):
+            batch = embeddings[start:start + ADD_BATCH_SIZE]
+            self.index.add(np.ascontiguousarray(batch, dtype=np.float32))
+
+    def _create_index(self, num_vectors: int):
+        """
+        Create an empty index of the configured type.
+
+        Args:
+            num_vectors: Number of vectors the index will be built from
+
+        Returns:
+            FAISS index using inner product metric
+        """
+        index_type = config.FAISS_INDEX_TYPE
+
+        if config.FAISS_QUANT not in SCALAR_QUANTIZER_TYPES:
+            raise ValueError(f"Unknown FAISS quantization: {config.FAISS_QUANT}")
+        qtype = SCALAR_QUANTIZER_TYPES[config.FAISS_QUANT]
+
+        if index_type == "flat":
+            # Exhaustive inner product search
+            if qtype is None:
+                return faiss.IndexFlatIP(self.dimension)
+            return faiss.IndexScalarQuantizer(self.dimension, qtype, faiss.METRIC_INNER_PRODUCT)
+
+        if index_type == "hnsw":
+            # Graph-based search, ~O(log N) per query
+            if qtype is None:
+                index = faiss.IndexHNSWFlat(self.dimension, config.FAISS_HNSW_M, faiss.METRIC_INNER_PRODUCT)
+            else:
+                index = faiss.IndexHNSWSQ(self.dimension, qtype, config.FAISS_HNSW_M, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = config.FAISS_HNSW_EF_CONSTRUCTION
+            return index
+
+        # ~4*sqrt(N) inverted lists, but keep >=39 training points per list
+        nlist = max(1, min(int(4 * np.sqrt(num_vectors)), num_vectors // 39))
+        quantizer = faiss.IndexFlatIP(self.dimension)
+
+        if index_type == "ivf":
+            if qtype is None:
+                return faiss.IndexIVFFlat(quantizer, self.dimension, nlist, faiss.METRIC_INNER_PRODUCT)
+            return faiss.IndexIVFScalarQuantizer(
+                quantizer, self.dimension, nlist, qtype, faiss.METRIC_INNER_PRODUCT
+            )
+
+        if index_type == "ivfpq":
+            # 8-bit codes need 256*39 training points; use fewer bits on small sets
+            nbits = int(np.clip(np.log2(max(num_vectors // 39, 2)), 1, 8))
+            return faiss.IndexIVFPQ(
+                quantizer, self.dimension, nlist, config.FAISS_PQ_M, nbits, faiss.METRIC_INNER_PRODUCT
+            )
+
+        raise ValueError(f"Unknown FAISS index type: {index_type}")
+
+    def _apply_search_params(self):
+        """Apply query-time parameters that are not stored with the index."""
+        ivf = faiss.try_extract_index_ivf(self.index)
+        if ivf is not None:
+            ivf.nprobe = min(config.FAISS_IVF_NPROBE, ivf.nlist)
+            # Requests search one query at a time, so split the probed lists
+            # across threads instead of parallelizing over queries
+            ivf.parallel_mode = config.FAISS_IVF_PARALLEL_MODE
+
+    def _move_to_gpu(self):
+        """Replace the index with a GPU copy when running on CUDA with faiss-gpu."""
+        if not config.FAISS_USE_GPU or config.DEVICE != "cuda":
+            return
+        if not hasattr(faiss, "StandardGpuResources") or faiss.get_num_gpus() == 0:
+            return
+
+        try:
+            resources = faiss.StandardGpuResources()
+            self.index = faiss.index_cpu_to_gpu(resources, 0, self.index)
+            self._gpu_resources = resources  # Must outlive the GPU index
+            print("FAISS index moved to GPU")
+        except RuntimeError as e:
+            # e.g. HNSW has no GPU implementation
+            print(f"Keeping FAISS index on CPU: {e}")
+
+    def add_vectors(self, embeddings: np.ndarray, image_paths: List[str]):
         """
         Add new vectors to existing index.
 
         Args:
             embeddings: numpy array of new embeddings
             image_paths: List of new image paths
-            metadata_list: Optional metadata for new images
         """
         if self.index is None:
             raise ValueError("Index not initialized. Call build_index first.")
@@ -73,22 +236,11 @@ class FAISSIndexManager:
         assert len(embeddings) == len(image_paths), "Embeddings and paths must have same length"
 
         # Add to FAISS index
-        self.index.add(embeddings.astype('float32'))
+        self._add_in_batches(embeddings)
 
         # Update metadata
-        start_idx = len(self.metadata["image_paths"])
-        self.metadata["image_paths"].extend(image_paths)
-        self.metadata["image_ids"].extend(range(start_idx, start_idx + len(image_paths)))
-
-        if metadata_list:
-            for idx, meta in enumerate(metadata_list):
-                self.metadata["metadata"][str(start_idx + idx)] = meta
-        else:
-            for idx, path in enumerate(image_paths):
-                self.metadata["metadata"][str(start_idx + idx)] = {
-                    "filename": Path(path).name,
-                    "path": str(path)
-                }
+        self._load_all_paths()
+        self.metadata["image_paths"].extend(str(path) for path in image_paths)
 
         print(f"Added {len(embeddings)} vectors. Total: {self.index.ntotal}")
 
@@ -109,34 +261,125 @@ class FAISSIndexManager:
         Returns:
             List of dicts with keys: image_path, score, metadata, image_id
         """
+        return self.search_batch(query_vector.reshape(1, -1), top_k, threshold)[0]
+
+    def search_batch(
+        self,
+        query_vectors: np.ndarray,
+        top_k: int = 20,
+        threshold: float = 0.0
+    ) -> List[List[Dict]]:
+        """
+        Search for similar images for several queries in one FAISS call.
+
+        Args:
+            query_vectors: Query embedding vectors, shape (Q, D) (1D is treated as Q=1)
+            top_k: Number of top results to return per query
+            threshold: Minimum similarity threshold (0-1)
+
+        Returns:
+            One result list per query, each as returned by search()
+        """
         if self.index is None:
             raise ValueError("Index not initialized. Load or build index first.")
 
-        # Ensure query vector is 2D and float32
-        if query_vector.ndim == 1:
-            query_vector = query_vector.reshape(1, -1)
-        query_vector = query_vector.astype('float32')
-
-        # Search
-        scores, indices = self.index.search(query_vector, top_k)
+        # Ensure query vectors are 2D, float32 and C-contiguous (no copy if they already are)
+        if query_vectors.ndim == 1:
+            query_vectors = query_vectors.reshape(1, -1)
+        query_vectors = np.ascontiguousarray(query_vectors, dtype=np.float32)
+
+        # Search (HNSW explores a candidate list that must be >= top_k;
+        # passed per call so concurrent requests don't share it)
+        params = None
+        if isinstance(self.index, faiss.IndexHNSW):
+            params = faiss.SearchParametersHNSW(efSearch=max(4 * top_k, config.FAISS_HNSW_EF_SEARCH))
+        scores, indices = self.index.search(query_vectors, top_k, params=params)
+
+        # Keep hits above threshold, then fetch their paths in one lookup
+        hits = [
+            [(idx, score) for score, idx in zip(query_scores, query_indices)
+             if idx != -1 and score >= threshold]  # FAISS returns -1 for empty slots
+            for query_scores, query_indices in zip(scores.tolist(), indices.tolist())
+        ]
+        hit_ids = sorted({idx for query_hits in hits for idx, _ in query_hits})
+        paths = dict(zip(hit_ids, self.get_image_paths(hit_ids)))
 
         # Format results
-        results = []
-        for score, idx in zip(scores[0], indices[0]):
-            if idx == -1:  # FAISS returns -1 for empty slots
-                continue
-
-            if score < threshold:
-                continue
+        all_results = []
+        for query_hits in hits:
+            results = []
+            for idx, score in query_hits:
+                image_path = paths[idx]
+                results.append({
+                    "image_id": idx,
+                    "image_path": image_path,
+                    "score": score,
+                    "metadata": {
+                        "filename": os.path.basename(image_path),
+                        "path": image_path
+                    }
+                })
+            all_results.append(results)
+
+        return all_results
+
+    def warmup(self):
+        """Run a dummy search so index memory is paged in before the first query."""
+        if self.index is None or self.index.ntotal == 0:
+            return
+
+        query_vector = np.zeros(self.dimension, dtype='float32')
+        query_vector[0] = 1.0
+        self.search(query_vector, top_k=10)
+
+    def get_image_paths(self, image_ids: List[int]) -> List[Optional[str]]:
+        """
+        Look up image paths by index position.
 
-            results.append({
-                "image_id": int(idx),
-                "image_path": self.metadata["image_paths"][idx],
-                "score": float(score),
-                "metadata": self.metadata["metadata"].get(str(idx), {})
-            })
+        Args:
+            image_ids: 0-based index positions
 
-        return results
+        Returns:
+            Image path for each id (None for ids not in the index)
+        """
+        if self._metadata_db is None:
+            image_paths = self.metadata["image_paths"]
+            return [image_paths[i] if 0 <= i < len(image_paths) else None for i in image_ids]
+
+        found = {}
+        unique_ids = list(set(image_ids))
+        with self._metadata_lock:
+            for start in range(0, len(unique_ids), METADATA_QUERY_CHUNK):
+                chunk = unique_ids[start:start + METADATA_QUERY_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                found.update(self._metadata_db.execute(
+                    f"SELECT id, path FROM meta WHERE id IN ({placeholders})", chunk
+                ).fetchall())
+        return [found.get(i) for i in image_ids]
+
+    @property
+    def num_images(self) -> int:
+        """Number of images in the metadata."""
+        if self._metadata_db is None:
+            return len(self.metadata["image_paths"])
+        with self._metadata_lock:
+            return self._metadata_db.execute("SELECT COUNT(*) FROM meta").fetchone()[0]
+
+    def _load_all_paths(self):
+        """Pull all image paths from metadata.sqlite into memory before modifying them."""
+        if self._metadata_db is None:
+            return
+        with self._metadata_lock:
+            rows = self._metadata_db.execute("SELECT path FROM meta ORDER BY id").fetchall()
+        self._close_metadata_db()
+        self.metadata["image_paths"] = [path for (path,) in rows]
+
+    def _close_metadata_db(self):
+        """Close the metadata.sqlite connection, if open."""
+        if self._metadata_db is not None:
+            with self._metadata_lock:
+                self._metadata_db.close()
+                self._metadata_db = None
 
     def save_index(self, index_path: Optional[Path] = None, metadata_path: Optional[Path] = None):
         """
@@ -152,13 +395,28 @@ class FAISSIndexManager:
         index_path = index_path or config.FAISS_INDEX_PATH
         metadata_path = metadata_path or config.METADATA_PATH
 
-        # Save FAISS index
-        faiss.write_index(self.index, str(index_path))
+        # Save FAISS index (GPU indexes are copied back to CPU for serialization)
+        index = self.index if self._gpu_resources is None else faiss.index_gpu_to_cpu(self.index)
+        faiss.write_index(index, str(index_path))
         print(f"FAISS index saved to {index_path}")
 
-        # Save metadata
-        with open(metadata_path, 'w', encoding='utf-8') as f:
-            json.dump(self.metadata, f, ensure_ascii=False, indent=2)
+        # Save metadata (written to a temp file first, then swapped in)
+        self._load_all_paths()
+        tmp_path = Path(f"{metadata_path}.tmp")
+        tmp_path.unlink(missing_ok=True)
+        conn = sqlite3.connect(tmp_path)
+        try:
+            conn.execute("CREATE TABLE meta (id INTEGER PRIMARY KEY, path TEXT NOT NULL)")
+            conn.executemany("INSERT INTO meta (id, path) VALUES (?, ?)", enumerate(self.metadata["image_paths"]))
+            conn.execute("CREATE TABLE info (key TEXT PRIMARY KEY, value TEXT)")
+            conn.executemany(
+                "INSERT INTO info (key, value) VALUES (?, ?)",
+                [*self.model_info.items(), *self.index_settings.items()]
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        os.replace(tmp_path, metadata_path)
         print(f"Metadata saved to {metadata_path}")
 
     def load_index(self, index_path: Optional[Path] = None, metadata_path: Optional[Path] = None):
@@ -170,7 +428,11 @@ class FAISSIndexManager:
             metadata_path: Path to metadata file (default: config.METADATA_PATH)
         """
         index_path = index_path or config.FAISS_INDEX_PATH
-        metadata_path = metadata_path or config.METADATA_PATH
+        if metadata_path is None:
+            metadata_path = config.METADATA_PATH
+            # Indexes saved before the SQLite metadata format
+            if not metadata_path.exists() and config.LEGACY_METADATA_PATH.exists():
+                metadata_path = config.LEGACY_METADATA_PATH
 
         if not index_path.exists():
             raise FileNotFoundError(f"Index file not found: {index_path}")
@@ -180,11 +442,33 @@ class FAISSIndexManager:
         # Load FAISS index
         self.index = faiss.read_index(str(index_path))
         self.dimension = self.index.d
+        self._gpu_resources = None
+        self._apply_search_params()
+        self._move_to_gpu()
         print(f"FAISS index loaded from {index_path} ({self.index.ntotal} vectors)")
 
         # Load metadata
-        with open(metadata_path, 'r', encoding='utf-8') as f:
-            self.metadata = json.load(f)
+        self._close_metadata_db()
+        with open(metadata_path, 'rb') as f:
+            is_sqlite = f.read(len(SQLITE_HEADER)) == SQLITE_HEADER
+        if not is_sqlite:
+            # Legacy JSON format: {"image_paths": [...], ...}, held in memory
+            with open(metadata_path, 'r', encoding='utf-8') as f:
+                self.metadata = {"image_paths": json.load(f)["image_paths"]}
+            info = {}
+        else:
+            # Paths stay on disk and are looked up per query
+            self.metadata = {"image_paths": []}
+            self._metadata_db = sqlite3.connect(
+                f"{metadata_path.resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False
+            )
+            try:
+                info = dict(self._metadata_db.execute("SELECT key, value FROM info").fetchall())
+            except sqlite3.OperationalError:
+                # Saved before the info table existed
+                info = {}
+        self.model_info = {key: value for key, value in info.items() if key not in INDEX_SETTING_KEYS}
+        self.index_settings = {key: value for key, value in info.items() if key in INDEX_SETTING_KEYS}
         print(f"Metadata loaded from {metadata_path}")
 
     def get_stats(self) -> Dict:
@@ -192,10 +476,14 @@ class FAISSIndexManager:
         if self.index is None:
             return {"status": "not_initialized"}
 
+        index_name = type(self.index).__name__
+        is_flat = isinstance(self.index, faiss.IndexFlat) or index_name.startswith("GpuIndexFlat")
+        search_kind = "exact" if is_flat else "approximate"
+
         return {
             "status": "initialized",
             "total_vectors": self.index.ntotal,
             "dimension": self.dimension,
-            "total_images": len(self.metadata["image_paths"]),
-            "index_type": "IndexFlatIP (exact search)"
+            "total_images": self.num_images,
+            "index_type": f"{index_name} ({search_kind} search)"
         }
@@ -1,9 +1,51 @@
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from pathlib import Path
+import numpy as np
 import config
 
+# Column order of bulk feedback count arrays
+FEEDBACK_TYPES = ('like', 'favorite', 'irrelevant')
+
+# Stay below SQLite's default bound-parameter limit on older builds
+SQLITE_MAX_VARIABLES = 900
+
+# Applied once to the long-lived connection
+CONNECTION_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',  # Readers don't block the writer
+    'PRAGMA synchronous=NORMAL',  # Safe with WAL; no fsync per commit
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA cache_size=-64000',  # 64 MB page cache
+)
+
+# Hot-path statements. sqlite3 keeps prepared statements in a per-connection
+# cache keyed by SQL text, so each of these is parsed and planned only once.
+INSERT_FEEDBACK_SQL = '''
+    INSERT INTO feedback (query, image_id, feedback_type, session_id)
+    VALUES (?, ?, ?, ?)
+'''
+
+# Insert, or add a batch of searches and fold their mean into the running average
+UPSERT_QUERY_STATS_SQL = '''
+    INSERT INTO query_stats (query, search_count, avg_top_score, last_search)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT(query) DO UPDATE SET
+        avg_top_score = (avg_top_score * search_count + excluded.avg_top_score * excluded.search_count)
+                        / (search_count + excluded.search_count),
+        search_count = search_count + excluded.search_count,
+        last_search = excluded.last_search
+'''
+
+SELECT_IMAGE_STATS_SQL = '''
+    SELECT likes, favorites, irrelevant
+    FROM image_stats
+    WHERE image_id = ?
+'''
+
 
 class FeedbackManager:
     """
@@ -13,48 +55,166 @@ class FeedbackManager:
 
     def __init__(self, db_path: Optional[Path] = None):
         self.db_path = db_path or config.FEEDBACK_DB_PATH
+
+        # One connection shared by all request threads (sqlite3 serializes
+        # access to it); autocommit mode, writers open explicit transactions
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        for pragma in CONNECTION_PRAGMAS:
+            self._conn.execute(pragma)
+        self._write_lock = threading.Lock()
+
+        # limit -> (monotonic time, results) for get_popular_queries
+        self._popular_cache = {}
+
+        # Write-behind buffer for update_query_stats:
+        # query -> [search count, sum of top scores, last search time]
+        self._stats_buf = {}
+        self._stats_pending = 0
+        self._stats_lock = threading.Lock()
+
         self._init_database()
 
+        # Background flush every QUERY_STATS_FLUSH_INTERVAL seconds, so an idle
+        # server doesn't sit on buffered stats
+        self._stop_flusher = threading.Event()
+        self._flusher = threading.Thread(target=self._run_flusher, name="query-stats-flusher", daemon=True)
+        self._flusher.start()
+
+    def close(self):
+        """Flush buffered query stats and close the database connection."""
+        self._stop_flusher.set()
+        self._flusher.join()
+        self.flush_stats()
+        with self._write_lock:
+            self._conn.close()
+
+    @contextmanager
+    def _write_transaction(self):
+        """Run writes in one transaction, serialized across threads."""
+        with self._write_lock:
+            cursor = self._conn.cursor()
+            # IMMEDIATE takes the write lock up front, so read-modify-write
+            # transactions from other processes can't deadlock on upgrade
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                yield cursor
+            except BaseException:
+                cursor.execute('ROLLBACK')
+                raise
+            cursor.execute('COMMIT')
+
     def _init_database(self):
         """Initialize database schema if not exists."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        with self._write_transaction() as cursor:
+            # Feedback records table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS feedback (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    query TEXT NOT NULL,
+                    image_id INTEGER NOT NULL,
+                    feedback_type TEXT NOT NULL,
+                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    session_id TEXT
+                )
+            ''')
+
+            # Query statistics table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS query_stats (
+                    query TEXT PRIMARY KEY,
+                    search_count INTEGER DEFAULT 1,
+                    avg_top_score REAL,
+                    last_search DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+
+            # Covering indexes: per-image counts and per-query history are
+            # answered from the index alone, without table lookups
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_feedback_image_cov
+                ON feedback(image_id, feedback_type)
+            ''')
 
-        # Feedback records table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS feedback (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                query TEXT NOT NULL,
-                image_id INTEGER NOT NULL,
-                feedback_type TEXT NOT NULL,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                session_id TEXT
-            )
-        ''')
-
-        # Query statistics table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS query_stats (
-                query TEXT PRIMARY KEY,
-                search_count INTEGER DEFAULT 1,
-                avg_top_score REAL,
-                last_search DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        # Create indexes for faster queries
-        cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_feedback_image_id
-            ON feedback(image_id)
-        ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_feedback_query_cov
+                ON feedback(query, timestamp DESC, image_id, feedback_type, session_id)
+            ''')
 
-        cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_feedback_query
-            ON feedback(query)
-        ''')
+            # Superseded by the covering indexes above
+            cursor.execute('DROP INDEX IF EXISTS idx_feedback_image_id')
+            cursor.execute('DROP INDEX IF EXISTS idx_feedback_query')
+
+            # Per-image feedback counters, kept current by triggers on feedback
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'image_stats'")
+            image_stats_exists = cursor.fetchone() is not None
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS image_stats (
+                    image_id INTEGER PRIMARY KEY,
+                    likes INTEGER NOT NULL DEFAULT 0,
+                    favorites INTEGER NOT NULL DEFAULT 0,
+                    irrelevant INTEGER NOT NULL DEFAULT 0,
+                    total INTEGER NOT NULL DEFAULT 0,
+                    score INTEGER NOT NULL DEFAULT 0  -- likes + favorites * 2
+                )
+            ''')
+
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_image_stats_score
+                ON image_stats(score DESC)
+            ''')
+
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS trg_feedback_insert_image_stats
+                AFTER INSERT ON feedback
+                BEGIN
+                    INSERT INTO image_stats (image_id, likes, favorites, irrelevant, total, score)
+                    VALUES (
+                        NEW.image_id,
+                        NEW.feedback_type = 'like',
+                        NEW.feedback_type = 'favorite',
+                        NEW.feedback_type = 'irrelevant',
+                        1,
+                        (NEW.feedback_type = 'like') + (NEW.feedback_type = 'favorite') * 2
+                    )
+                    ON CONFLICT(image_id) DO UPDATE SET
+                        likes = likes + excluded.likes,
+                        favorites = favorites + excluded.favorites,
+                        irrelevant = irrelevant + excluded.irrelevant,
+                        total = total + 1,
+                        score = score + excluded.score;
+                END
+            ''')
+
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS trg_feedback_delete_image_stats
+                AFTER DELETE ON feedback
+                BEGIN
+                    UPDATE image_stats SET
+                        likes = likes - (OLD.feedback_type = 'like'),
+                        favorites = favorites - (OLD.feedback_type = 'favorite'),
+                        irrelevant = irrelevant - (OLD.feedback_type = 'irrelevant'),
+                        total = total - 1,
+                        score = score - (OLD.feedback_type = 'like') - (OLD.feedback_type = 'favorite') * 2
+                    WHERE image_id = OLD.image_id;
+                END
+            ''')
+
+            # Databases created before image_stats: backfill from existing feedback
+            if not image_stats_exists:
+                cursor.execute('''
+                    INSERT INTO image_stats (image_id, likes, favorites, irrelevant, total, score)
+                    SELECT
+                        image_id,
+                        SUM(feedback_type = 'like'),
+                        SUM(feedback_type = 'favorite'),
+                        SUM(feedback_type = 'irrelevant'),
+                        COUNT(*),
+                        SUM(feedback_type = 'like') + SUM(feedback_type = 'favorite') * 2
+                    FROM feedback
+                    GROUP BY image_id
+                ''')
 
-        conn.commit()
-        conn.close()
         print(f"Feedback database initialized at {self.db_path}")
 
     def record_feedback(
@@ -79,52 +239,108 @@ class FeedbackManager:
         if feedback_type not in ['like', 'favorite', 'irrelevant']:
             raise ValueError(f"Invalid feedback type: {feedback_type}")
 
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        with self._write_transaction() as cursor:
+            cursor.execute(INSERT_FEEDBACK_SQL, (query, image_id, feedback_type, session_id))
 
-        cursor.execute('''
-            INSERT INTO feedback (query, image_id, feedback_type, session_id)
-            VALUES (?, ?, ?, ?)
-        ''', (query, image_id, feedback_type, session_id))
+        return True
 
-        conn.commit()
-        conn.close()
+    def record_feedback_bulk(self, rows: List[Tuple[str, int, str, Optional[str]]]) -> int:
+        """
+        Record many feedback entries in one transaction.
 
-        return True
+        Args:
+            rows: (query, image_id, feedback_type, session_id) tuples
+
+        Returns:
+            Number of rows recorded
+        """
+        rows = [tuple(row) for row in rows]
+        for i, row in enumerate(rows):
+            if len(row) != 4:
+                raise ValueError(f"Feedback row {i}: need 4 fields, got {len(row)}")
+            query, image_id, feedback_type, session_id = row
+            if not isinstance(query, str):
+                raise ValueError(f"Feedback row {i}: query must be a string")
+            # image_stats.image_id is an INTEGER PRIMARY KEY; bools are ints but not ids
+            if not isinstance(image_id, int) or isinstance(image_id, bool):
+                raise ValueError(f"Feedback row {i}: image_id must be an integer")
+            if feedback_type not in FEEDBACK_TYPES:
+                raise ValueError(f"Feedback row {i}: invalid feedback type: {feedback_type}")
+            if session_id is not None and not isinstance(session_id, str):
+                raise ValueError(f"Feedback row {i}: session_id must be a string or None")
+
+        if not rows:
+            return 0
+
+        with self._write_transaction() as cursor:
+            cursor.executemany(INSERT_FEEDBACK_SQL, rows)
+
+        return len(rows)
 
     def update_query_stats(self, query: str, top_score: float):
         """
         Update query statistics.
 
+        Updates are buffered in memory and written in one transaction every
+        QUERY_STATS_FLUSH_COUNT searches, every QUERY_STATS_FLUSH_INTERVAL
+        seconds (background thread), before query_stats is read, and on close().
+
         Args:
             query: Search query
             top_score: Similarity score of top result
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        # Check if query exists
-        cursor.execute('SELECT search_count, avg_top_score FROM query_stats WHERE query = ?', (query,))
-        result = cursor.fetchone()
-
-        if result:
-            count, avg_score = result
-            new_count = count + 1
-            new_avg = (avg_score * count + top_score) / new_count
-
-            cursor.execute('''
-                UPDATE query_stats
-                SET search_count = ?, avg_top_score = ?, last_search = ?
-                WHERE query = ?
-            ''', (new_count, new_avg, datetime.now(), query))
-        else:
-            cursor.execute('''
-                INSERT INTO query_stats (query, search_count, avg_top_score, last_search)
-                VALUES (?, 1, ?, ?)
-            ''', (query, top_score, datetime.now()))
-
-        conn.commit()
-        conn.close()
+        with self._stats_lock:
+            entry = self._stats_buf.get(query)
+            if entry is None:
+                self._stats_buf[query] = [1, top_score, datetime.now()]
+            else:
+                entry[0] += 1
+                entry[1] += top_score
+                entry[2] = datetime.now()
+            self._stats_pending += 1
+            flush_due = self._stats_pending >= config.QUERY_STATS_FLUSH_COUNT
+
+        if flush_due:
+            self.flush_stats()
+
+    def flush_stats(self):
+        """Write buffered query statistics to the database."""
+        with self._stats_lock:
+            buffered = self._stats_buf
+            self._stats_buf = {}
+            self._stats_pending = 0
+
+        if not buffered:
+            return
+
+        rows = [
+            (query, count, score_sum / count, last_search)
+            for query, (count, score_sum, last_search) in buffered.items()
+        ]
+        try:
+            with self._write_transaction() as cursor:
+                cursor.executemany(UPSERT_QUERY_STATS_SQL, rows)
+        except Exception:
+            # Put the aggregates back so the next flush retries them
+            with self._stats_lock:
+                for query, (count, score_sum, last_search) in buffered.items():
+                    entry = self._stats_buf.get(query)
+                    if entry is None:
+                        self._stats_buf[query] = [count, score_sum, last_search]
+                    else:
+                        entry[0] += count
+                        entry[1] += score_sum
+                        entry[2] = max(entry[2], last_search)
+                    self._stats_pending += count
+            raise
+
+    def _run_flusher(self):
+        """Background loop: flush buffered query stats until close()."""
+        while not self._stop_flusher.wait(config.QUERY_STATS_FLUSH_INTERVAL):
+            try:
+                self.flush_stats()
+            except Exception as e:
+                print(f"Failed to flush query stats, will retry: {e}")
 
     def get_feedback_stats(self, image_id: int) -> Dict:
         """
@@ -136,24 +352,50 @@ class FeedbackManager:
         Returns:
             Dict with counts for each feedback type
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        cursor = self._conn.cursor()
 
-        cursor.execute('''
-            SELECT feedback_type, COUNT(*)
-            FROM feedback
-            WHERE image_id = ?
-            GROUP BY feedback_type
-        ''', (image_id,))
+        # Primary-key lookup of the trigger-maintained counters
+        cursor.execute(SELECT_IMAGE_STATS_SQL, (image_id,))
 
-        results = cursor.fetchall()
-        conn.close()
+        counts = cursor.fetchone() or (0, 0, 0)
+
+        return dict(zip(FEEDBACK_TYPES, counts))
 
-        stats = {'like': 0, 'favorite': 0, 'irrelevant': 0}
-        for feedback_type, count in results:
-            stats[feedback_type] = count
+    def get_feedback_stats_bulk(self, image_ids: List[int]) -> np.ndarray:
+        """
+        Get feedback statistics for many images with one query.
+
+        Args:
+            image_ids: List of image IDs
+
+        Returns:
+            Int array of shape (N, 3) with like/favorite/irrelevant counts,
+            rows in the same order as image_ids
+        """
+        counts = np.zeros((len(image_ids), len(FEEDBACK_TYPES)), dtype=np.int64)
+        if not image_ids:
+            return counts
+
+        rows_by_id = {}
+        for row, image_id in enumerate(image_ids):
+            rows_by_id.setdefault(image_id, []).append(row)
 
-        return stats
+        cursor = self._conn.cursor()
+
+        unique_ids = list(rows_by_id)
+        for start in range(0, len(unique_ids), SQLITE_MAX_VARIABLES):
+            chunk = unique_ids[start:start + SQLITE_MAX_VARIABLES]
+            placeholders = ','.join('?' * len(chunk))
+            cursor.execute(f'''
+                SELECT image_id, likes, favorites, irrelevant
+                FROM image_stats
+                WHERE image_id IN ({placeholders})
+            ''', chunk)
+
+            for image_id, *image_counts in cursor.fetchall():
+                counts[rows_by_id[image_id]] = image_counts
+
+        return counts
 
     def get_popular_queries(self, limit: int = 10) -> List[Dict]:
         """
@@ -165,8 +407,13 @@ class FeedbackManager:
         Returns:
             List of dicts with query stats
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        # Popularity shifts slowly; reuse results for POPULAR_QUERIES_CACHE_TTL seconds
+        cached = self._popular_cache.get(limit)
+        if cached is not None and time.monotonic() - cached[0] < config.POPULAR_QUERIES_CACHE_TTL:
+            return list(cached[1])
+
+        self.flush_stats()
+        cursor = self._conn.cursor()
 
         cursor.execute('''
             SELECT query, search_count, avg_top_score, last_search
@@ -176,9 +423,8 @@ class FeedbackManager:
         ''', (limit,))
 
         results = cursor.fetchall()
-        conn.close()
 
-        return [
+        popular = [
             {
                 'query': row[0],
                 'search_count': row[1],
@@ -187,6 +433,9 @@ class FeedbackManager:
             }
             for row in results
         ]
+        self._popular_cache[limit] = (time.monotonic(), popular)
+
+        return list(popular)
 
     def get_top_rated_images(self, limit: int = 20) -> List[Dict]:
         """
@@ -198,25 +447,18 @@ class FeedbackManager:
         Returns:
             List of dicts with image stats
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        cursor = self._conn.cursor()
 
+        # Top-K scan of the score index over precomputed counters
         cursor.execute('''
-            SELECT
-                image_id,
-                SUM(CASE WHEN feedback_type = 'like' THEN 1 ELSE 0 END) as likes,
-                SUM(CASE WHEN feedback_type = 'favorite' THEN 1 ELSE 0 END) as favorites,
-                SUM(CASE WHEN feedback_type = 'irrelevant' THEN 1 ELSE 0 END) as irrelevant,
-                COUNT(*) as total_feedback
-            FROM feedback
-            GROUP BY image_id
-            HAVING likes + favorites > irrelevant
-            ORDER BY (likes + favorites * 2) DESC
+            SELECT image_id, likes, favorites, irrelevant, total
+            FROM image_stats
+            WHERE likes + favorites > irrelevant
+            ORDER BY score DESC, image_id
             LIMIT ?
         ''', (limit,))
 
         results = cursor.fetchall()
-        conn.close()
 
         return [
             {
@@ -239,8 +481,7 @@ class FeedbackManager:
         Returns:
             List of feedback records
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        cursor = self._conn.cursor()
 
         cursor.execute('''
             SELECT image_id, feedback_type, timestamp, session_id
@@ -250,7 +491,6 @@ class FeedbackManager:
         ''', (query,))
 
         results = cursor.fetchall()
-        conn.close()
 
         return [
             {
@@ -1,34 +1,125 @@
 """
-生成图片向量并保存为pkl文件
+生成图片向量并保存为npy文件（路径等信息保存在json文件中）
 用法: python get_embeddings.py
 """
 
 import torch
+import torch.nn.functional as F
 import open_clip
 from PIL import Image
 import os
-import pickle
+import json
+from torch.utils.data import Dataset, DataLoader
 from tqdm import tqdm
 import numpy as np
 
 # 配置
 IMAGE_FOLDER = "./data/images"
-OUTPUT_FILE = "image_embeddings.pkl"
+OUTPUT_FILE = "image_embeddings.npy"
+PATHS_FILE = "image_paths.json"
 MODEL_NAME = 'ViT-B-32'
 PRETRAINED = './models/ViT-B-32-laion2B-s34B-b79K/open_clip_pytorch_model.bin'
+# 以FP16保存embeddings，文件体积和加载带宽减半（归一化向量精度损失可忽略）
+EMBEDDING_DTYPE = np.float16
+# 每次前向推理的图片数量（批量推理，避免逐张调用encode_image）
+BATCH_SIZE = 128
+# CUDA上用FP16 autocast推理（Tensor Core，显存带宽减半）；CPU上不启用
+USE_AMP = True
+# CUDA上用torch.compile编译视觉编码器（固定批大小下CUDA Graph捕获，减少逐算子调度开销）
+COMPILE_MODEL = True
+# DataLoader解码+预处理的工作进程数，以及每个进程预取的批次数
+NUM_WORKERS = min(8, os.cpu_count() or 1)
+PREFETCH_FACTOR = 4
+# 有图片出错时，去掉空行复制到最终文件，每次复制的行数
+COPY_CHUNK_ROWS = 65536
 
 def get_image_files(folder):
-    """获取文件夹中所有图片文件"""
+    """获取文件夹中所有图片文件（os.scandir递归遍历，利用DirEntry缓存的类型信息）"""
     extensions = {'.jpg', '.jpeg', '.png', '.webp', '.bmp', '.gif'}
     image_files = []
 
-    for root, dirs, files in os.walk(folder):
-        for file in files:
-            if os.path.splitext(file.lower())[1] in extensions:
-                image_files.append(os.path.join(root, file))
+    pending_dirs = [folder]
+    while pending_dirs:
+        directory = pending_dirs.pop()
+        try:
+            entries = os.scandir(directory)
+        except OSError as e:
+            # 与os.walk一致：跳过无法读取的目录，不中断整个扫描
+            print(f"⚠️  无法读取目录 {directory}: {e}")
+            continue
+
+        with entries:
+            for entry in entries:
+                if entry.is_dir():
+                    # 与os.walk一致：不进入符号链接指向的目录
+                    if not entry.is_symlink():
+                        pending_dirs.append(entry.path)
+                # 只对扩展名转小写，不复制整个文件名
+                elif os.path.splitext(entry.name)[1].lower() in extensions:
+                    image_files.append(entry.path)
 
     return sorted(image_files)
 
+class ImageDataset(Dataset):
+    """按路径加载并预处理图片；出错的图片返回(None, 路径, 错误信息)，不中断整批"""
+
+    def __init__(self, image_files, preprocess):
+        self.image_files = image_files
+        self.preprocess = preprocess
+
+    def __len__(self):
+        return len(self.image_files)
+
+    def __getitem__(self, idx):
+        img_path = self.image_files[idx]
+        try:
+            image = Image.open(img_path).convert('RGB')
+            return self.preprocess(image), img_path, None
+        except Exception as e:
+            return None, img_path, str(e)
+
+def collate_images(samples):
+    """合并一批样本：成功的图片堆叠成张量，失败的单独返回[(路径, 错误)]"""
+    tensors = [tensor for tensor, _, _ in samples if tensor is not None]
+    paths = [path for tensor, path, _ in samples if tensor is not None]
+    failures = [(path, error) for tensor, path, error in samples if tensor is None]
+    images = torch.stack(tensors) if tensors else None
+    return images, paths, failures
+
+def encode_batch(model, images, device, pad_to=None):
+    """
+    将一批预处理后的图片张量(B, 3, H, W)一次性编码并L2归一化，返回(B, D)的EMBEDDING_DTYPE数组。
+    pad_to: 不足该批大小时用最后一张图补齐再推理（编译后的模型始终看到同一形状，
+    不会因最后一批或有出错图片的批次而重新编译/重新捕获CUDA Graph），结果只取前B行
+    """
+    num_images = len(images)
+    batch = images.to(device, non_blocking=True)
+    if pad_to is not None and num_images < pad_to:
+        padding = batch[-1:].expand(pad_to - num_images, *batch.shape[1:])
+        batch = torch.cat([batch, padding])
+    with torch.autocast(device_type=device, dtype=torch.float16, enabled=USE_AMP and device == "cuda"):
+        features = model.encode_image(batch)
+    features = F.normalize(features[:num_images].float(), dim=-1)
+    return features.cpu().numpy().astype(EMBEDDING_DTYPE, copy=False)
+
+def finalize_embeddings(tmp_file, num_written):
+    """将边写边存的临时npy文件落盘为OUTPUT_FILE；有出错图片时分块复制前num_written行，内存占用不随图片数增长"""
+    embeddings = np.load(tmp_file, mmap_mode='r')
+    if num_written == len(embeddings):
+        del embeddings
+        os.replace(tmp_file, OUTPUT_FILE)
+        return
+
+    output = np.lib.format.open_memmap(
+        OUTPUT_FILE, mode='w+', dtype=EMBEDDING_DTYPE, shape=(num_written, embeddings.shape[1])
+    )
+    for start in range(0, num_written, COPY_CHUNK_ROWS):
+        end = min(start + COPY_CHUNK_ROWS, num_written)
+        output[start:end] = embeddings[start:end]
+    output.flush()
+    del output, embeddings
+    os.remove(tmp_file)
+
 def generate_embeddings():
     """为所有图片生成embeddings"""
     print(f"🔧 加载CLIP模型: {MODEL_NAME}")
@@ -43,6 +134,15 @@ def generate_embeddings():
     model = model.to(device)
     model.eval()
 
+    # 编译后每批都补齐到BATCH_SIZE，保持输入形状固定
+    pad_to = None
+    if COMPILE_MODEL and device == "cuda":
+        try:
+            model.visual = torch.compile(model.visual, mode="reduce-overhead")
+            pad_to = BATCH_SIZE
+        except Exception as e:
+            print(f"⚠️  torch.compile不可用，使用eager模式: {e}")
+
     print(f"\n📂 扫描图片文件夹: {IMAGE_FOLDER}")
     image_files = get_image_files(IMAGE_FOLDER)
 
@@ -53,52 +153,64 @@ def generate_embeddings():
 
     print(f"✅ 找到 {len(image_files)} 张图片")
 
-    # 生成embeddings
-    embeddings = []
+    # 生成embeddings：每批直接写入磁盘上的npy内存映射文件（open_memmap），
+    # 不在内存中保留全部结果，百万级图片也只占常数内存
+    tmp_file = OUTPUT_FILE + ".tmp"
+    embeddings = None
+    num_written = 0
     valid_files = []
 
     print("\n🔄 生成embeddings...")
-    with torch.no_grad():
-        for img_path in tqdm(image_files, desc="处理进度"):
-            try:
-                # 加载并预处理图片
-                image = Image.open(img_path).convert('RGB')
-                image_input = preprocess(image).unsqueeze(0).to(device)
-
-                # 生成embedding
-                image_features = model.encode_image(image_input)
-                # L2归一化
-                image_features = image_features / image_features.norm(dim=-1, keepdim=True)
-
-                embeddings.append(image_features.cpu().numpy())
-                valid_files.append(img_path)
-
-            except Exception as e:
-                print(f"\n⚠️  处理 {img_path} 时出错: {e}")
-                continue
-
-    if not embeddings:
+    # 多进程解码+预处理，与模型推理重叠；CUDA上使用锁页内存以便异步拷贝
+    loader = DataLoader(
+        ImageDataset(image_files, preprocess),
+        batch_size=BATCH_SIZE,
+        num_workers=NUM_WORKERS,
+        collate_fn=collate_images,
+        pin_memory=device == "cuda",
+        prefetch_factor=PREFETCH_FACTOR if NUM_WORKERS > 0 else None
+    )
+    with torch.inference_mode(), tqdm(total=len(image_files), desc="处理进度") as progress:
+        for images, paths, failures in loader:
+            for img_path, error in failures:
+                print(f"\n⚠️  处理 {img_path} 时出错: {error}")
+
+            if images is not None:
+                features = encode_batch(model, images, device, pad_to)
+                if embeddings is None:
+                    embeddings = np.lib.format.open_memmap(
+                        tmp_file, mode='w+', dtype=EMBEDDING_DTYPE,
+                        shape=(len(image_files), features.shape[1])
+                    )
+                embeddings[num_written:num_written + len(features)] = features
+                num_written += len(features)
+                valid_files.extend(paths)
+
+            progress.update(len(paths) + len(failures))
+
+    if embeddings is None:
         print("❌ 没有成功生成任何embeddings")
         return
 
-    # 合并embeddings
-    embeddings = np.vstack(embeddings)
-
-    # 保存到pickle文件
+    # 路径和模型信息保存为json
     data = {
-        'embeddings': embeddings,
         'image_paths': valid_files,
         'model_name': MODEL_NAME,
         'pretrained': PRETRAINED
     }
 
     print(f"\n💾 保存embeddings到 {OUTPUT_FILE}")
-    with open(OUTPUT_FILE, 'wb') as f:
-        pickle.dump(data, f)
+    embedding_dim = embeddings.shape[1]
+    embeddings.flush()
+    del embeddings
+    # 去掉出错图片留下的空行
+    finalize_embeddings(tmp_file, num_written)
+    with open(PATHS_FILE, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
 
     print(f"✅ 成功为 {len(valid_files)} 张图片生成embeddings")
-    print(f"📦 Embedding维度: {embeddings.shape}")
-    print(f"💾 已保存到: {OUTPUT_FILE}")
+    print(f"📦 Embedding维度: {(num_written, embedding_dim)}")
+    print(f"💾 已保存到: {OUTPUT_FILE}, {PATHS_FILE}")
     print(f"\n🚀 现在可以运行 python build_faiss_index.py 来构建FAISS索引")
 
 if __name__ == "__main__":
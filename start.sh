@@ -10,8 +10,18 @@ PID=$(lsof -ti:$PORT)
 if [ ! -z "$PID" ]; then
     echo "⚠️  端口 $PORT 已被进程 $PID 占用"
     echo "🔪 正在终止进程 $PID..."
-    kill -9 $PID
-    sleep 1
+    # 先发SIGTERM让应用正常退出，超时后再强制终止
+    kill $PID
+    for _ in $(seq 1 10); do
+        if ! lsof -ti:$PORT > /dev/null 2>&1; then
+            break
+        fi
+        sleep 1
+    done
+    if lsof -ti:$PORT > /dev/null 2>&1; then
+        kill -9 $(lsof -ti:$PORT)
+        sleep 1
+    fi
     echo "✅ 进程已终止"
 fi
 
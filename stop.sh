@@ -13,10 +13,20 @@ fi
 
 echo "⚠️  发现进程 $PID 运行在端口 $PORT"
 echo "🔪 正在终止进程..."
-kill -9 $PID
+# 先发SIGTERM，让应用执行退出钩子（写入缓冲的查询统计）；超时后再强制终止
+kill $PID
+for _ in $(seq 1 10); do
+    if ! lsof -ti:$PORT > /dev/null 2>&1; then
+        break
+    fi
+    sleep 1
+done
 
-# 等待进程终止
-sleep 1
+if lsof -ti:$PORT > /dev/null 2>&1; then
+    echo "⚠️  进程未在10秒内退出，强制终止"
+    kill -9 $(lsof -ti:$PORT)
+    sleep 1
+fi
 
 # 验证进程是否已终止
 if lsof -ti:$PORT > /dev/null 2>&1; then
@@ -0,0 +1,79 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Union
+
+import numpy as np
+
+
+class BatchTextEncoder:
+    """
+    Micro-batching front end for CLIPModelWrapper.encode_text.
+
+    Concurrent callers put their texts on a queue; a single background thread
+    collects whatever arrives within a short window (up to max_batch_size)
+    and encodes it in one forward pass, then hands each caller its vectors.
+    """
+
+    def __init__(self, clip_model, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.clip_model = clip_model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+
+        self._worker = threading.Thread(target=self._run, name="batch-text-encoder", daemon=True)
+        self._worker.start()
+
+    def encode_text(self, text: Union[str, List[str]]) -> np.ndarray:
+        """
+        Encode text to feature vector(s), batched with concurrent callers.
+
+        Args:
+            text: Single text string or list of text strings
+
+        Returns:
+            Normalized feature vector(s) as numpy array, shape (N, D)
+        """
+        if isinstance(text, str):
+            text = [text]
+
+        futures = []
+        for item in text:
+            future = Future()
+            self._queue.put((item, future))
+            futures.append(future)
+
+        return np.stack([future.result() for future in futures])
+
+    def _collect_batch(self) -> list:
+        """Block for one request, then gather more until the batch is full or the window closes."""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _run(self):
+        """Worker loop: encode collected batches and resolve their futures."""
+        while True:
+            batch = self._collect_batch()
+            texts = [text for text, _ in batch]
+
+            try:
+                vectors = self.clip_model.encode_text(texts)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
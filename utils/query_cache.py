@@ -0,0 +1,158 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Tuple, Union
+
+import numpy as np
+import config
+
+
+class LRUCache:
+    """
+    Thread-safe bounded LRU cache backed by an OrderedDict.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Get a cached value and mark it as most recently used.
+
+        Args:
+            key: Cache key
+            default: Value returned on miss
+
+        Returns:
+            Cached value or default
+        """
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return default
+            return self._data[key]
+
+    def put(self, key: Hashable, value: Any):
+        """
+        Store a value, evicting the least recently used entry when full.
+
+        Args:
+            key: Cache key
+            value: Value to store
+        """
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        """Remove all cached entries."""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+# Process-wide cache of text query embeddings, keyed by the (enhanced) query text
+_text_embedding_cache = LRUCache(maxsize=config.TEXT_EMBEDDING_CACHE_SIZE)
+
+
+def get_text_embedding(text_encoder, query: Union[str, Tuple[str, ...]]) -> np.ndarray:
+    """
+    Get the normalized CLIP embedding of a text query, using the LRU cache.
+
+    Args:
+        text_encoder: Object with encode_text() (CLIPModelWrapper or
+            BatchTextEncoder), used on cache miss
+        query: Query text (already enhanced if enhancement is wanted), or a
+            tuple of prompts whose embeddings are averaged (prompt ensembling)
+
+    Returns:
+        Normalized float32 feature vector (read-only, do not modify in place)
+    """
+    vector = _text_embedding_cache.get(query)
+    if vector is None:
+        if isinstance(query, str):
+            vector = np.ascontiguousarray(text_encoder.encode_text(query)[0], dtype=np.float32)
+        else:
+            # All prompts go through the encoder as one batch
+            vector = text_encoder.encode_text(list(query)).mean(axis=0, dtype=np.float32)
+            vector /= np.linalg.norm(vector)
+        vector.setflags(write=False)
+        _text_embedding_cache.put(query, vector)
+    return vector
+
+
+class SemanticResultCache:
+    """
+    FIFO cache of search results looked up by query embedding similarity.
+    Near-duplicate queries ("red car" vs "a red car") reuse the cached results,
+    skipping the FAISS search entirely.
+    """
+
+    def __init__(self, maxsize: int = 256, threshold: float = 0.98):
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self._vectors = None  # (maxsize, D) ring buffer, allocated on first add
+        self._keys = [None] * maxsize
+        self._results = [None] * maxsize
+        self._size = 0
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def lookup(self, query_vector: np.ndarray, key: Hashable = None):
+        """
+        Find cached results for a query whose embedding is close enough.
+
+        Args:
+            query_vector: Normalized query embedding (1D array)
+            key: Extra key that must match exactly (e.g. top_k)
+
+        Returns:
+            Cached results list, or None on miss
+        """
+        with self._lock:
+            if self._size == 0:
+                return None
+
+            # Inner product = cosine similarity for normalized vectors
+            sims = self._vectors[:self._size] @ query_vector
+            best_idx, best_sim = None, self.threshold
+            for idx in np.flatnonzero(sims > self.threshold):
+                if self._keys[idx] == key and sims[idx] > best_sim:
+                    best_idx, best_sim = idx, sims[idx]
+
+            if best_idx is None:
+                return None
+            return self._results[best_idx]
+
+    def add(self, query_vector: np.ndarray, results: list, key: Hashable = None):
+        """
+        Cache results for a query embedding, evicting the oldest entry when full.
+
+        Args:
+            query_vector: Normalized query embedding (1D array)
+            results: Search results to cache (treated as read-only)
+            key: Extra key that must match exactly on lookup
+        """
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.maxsize, query_vector.shape[0]), dtype=np.float32)
+
+            self._vectors[self._next] = query_vector
+            self._keys[self._next] = key
+            self._results[self._next] = results
+            self._next = (self._next + 1) % self.maxsize
+            self._size = min(self._size + 1, self.maxsize)
+
+    def clear(self):
+        """Remove all cached entries."""
+        with self._lock:
+            self._keys = [None] * self.maxsize
+            self._results = [None] * self.maxsize
+            self._size = 0
+            self._next = 0
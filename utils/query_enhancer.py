@@ -1,6 +1,20 @@
+import functools
 import re
+from typing import Tuple
 
+# Templates averaged by prompt ensembling ({} = the user query)
+PROMPT_TEMPLATES = ("{}", "a photo of {}", "a picture of {}", "an image of {}")
 
+# Queries starting with these (case-insensitive) are left as they are
+QUERY_PREFIXES = ('a photo of', 'an image of', 'a picture of', 'photo of', 'image of')
+
+_PREFIX_HEAD = max(len(prefix) for prefix in QUERY_PREFIXES)
+_MAX_WORDS = 5  # Longer queries are treated as complete sentences
+
+_CJK_RE = re.compile(r'[\u4e00-\u9fff]')
+
+
+@functools.lru_cache(maxsize=4096)
 def enhance_query(query: str) -> str:
     """
     Enhance user query for better CLIP retrieval.
@@ -17,21 +31,19 @@ def enhance_query(query: str) -> str:
     if not query:
         return query
 
-    # Check if it's a simple query (1-2 words)
-    words = query.split()
+    # Count words, but stop splitting once there are too many to matter
+    num_words = len(query.split(maxsplit=_MAX_WORDS))
 
     # Don't enhance if it's already a complete sentence
-    if len(words) > 5 or query.endswith('.') or query.endswith('?'):
+    if num_words > _MAX_WORDS or query.endswith(('.', '?')):
         return query
 
-    # Don't enhance if it starts with common prefixes
-    prefixes = ['a photo of', 'an image of', 'a picture of', 'photo of', 'image of']
-    query_lower = query.lower()
-    if any(query_lower.startswith(prefix) for prefix in prefixes):
+    # Don't enhance if it starts with common prefixes (only the head needs lowercasing)
+    if query[:_PREFIX_HEAD].lower().startswith(QUERY_PREFIXES):
         return query
 
     # For simple queries, add "a photo of" prefix
-    if len(words) <= 3:
+    if num_words <= 3:
         # Check if it contains Chinese characters
         if contains_chinese(query):
             # For Chinese queries, don't add prefix as CLIP handles it well
@@ -42,6 +54,20 @@ def enhance_query(query: str) -> str:
     return query
 
 
+def ensemble_prompts(query: str) -> Tuple[str, ...]:
+    """
+    Build prompt-ensemble variants of a query.
+
+    Args:
+        query: Raw user query (one that enhance_query would prefix)
+
+    Returns:
+        Tuple of prompts, one per template in PROMPT_TEMPLATES
+    """
+    query = query.strip()
+    return tuple(template.format(query) for template in PROMPT_TEMPLATES)
+
+
 def contains_chinese(text: str) -> bool:
     """
     Check if text contains Chinese characters.
@@ -52,7 +78,7 @@ def contains_chinese(text: str) -> bool:
     Returns:
         True if contains Chinese characters
     """
-    return bool(re.search(r'[\u4e00-\u9fff]', text))
+    return _CJK_RE.search(text) is not None
 
 
 def is_simple_query(query: str) -> bool: